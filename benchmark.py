@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Benchmark harness for the render pipeline. Each stage is timed over
+# several problem sizes (best of N runs) and its peak traced memory is
+# recorded from one extra run. Results are written to JSON and can be
+# compared against a stored baseline to catch regressions.
+#
+#   python benchmark.py                       # full run, writes benchmark_results.json
+#   python benchmark.py --quick               # small sizes only
+#   python benchmark.py --save-baseline       # store results as the baseline
+#   python benchmark.py --baseline benchmark_baseline.json --threshold 0.2
+
+SIZES = {
+    'grid': [50, 150, 300],             # theta/phi points per axis
+    'frames': [10, 60],                 # animation frames
+    'particles': [1_000, 100_000, 1_000_000],
+}
+QUICK_SIZES = {
+    'grid': [50, 150],
+    'frames': [10],
+    'particles': [1_000, 100_000],
+}
+
+
+def make_grid(n):
+    """The (theta, phi) meshgrid used by superposition.py, n points per axis"""
+    theta = np.linspace(0, 2 * np.pi, n)
+    phi = np.linspace(0, np.pi, n)
+    return np.meshgrid(theta, phi)
+
+
+def sphere_animation(grid, n_frames):
+    """SphereAnimation on a grid x grid mesh, bypassing the harmonic cache"""
+    import scipy.special
+    from superposition import SphereAnimation
+
+    # scipy.special has the sph_harm_y the cache would otherwise wrap
+    return SphereAnimation(grid_resolution=grid, num_frames=n_frames, harmonics=scipy.special)
+
+
+def build_figure(grid, n_frames):
+    """Animated figure with n_frames go.Frames on a grid x grid mesh"""
+    return sphere_animation(grid, n_frames).build_figure()
+
+
+# Each stage takes its size parameters and returns a zero-argument callable
+# to time; work done before returning is setup and is not measured.
+
+def stage_harmonics(grid):
+    """scipy sph_harm_y evaluation of the two terms of the original pattern"""
+    from scipy.special import sph_harm_y
+
+    theta, phi = make_grid(grid)
+    return lambda: (sph_harm_y(-3, 3, phi, theta), sph_harm_y(3, 3, phi, theta))
+
+
+def stage_geometry(grid, frames):
+    """Per-frame sphere geometry for both spheres"""
+    animation = sphere_animation(grid, frames)
+    return lambda: [animation.compute_frame(i) for i in range(frames)]
+
+
+def stage_geometry_batched(grid, frames):
+    """Sphere geometry of every frame, radial fields computed in frame_chunk_mb batches"""
+    animation = sphere_animation(grid, frames)
+    return lambda: list(animation.compute_frames(range(frames)))
+
+
+def stage_frames(grid, frames):
+    """go.Frame construction (including plotly validation)"""
+    import plotly.graph_objects as go
+
+    animation = sphere_animation(grid, frames)
+    surfaces = [animation.compute_frame(i) for i in range(frames)]
+    return lambda: [go.Frame(data=animation.sphere_traces(*s), name=str(i)) for i, s in enumerate(surfaces)]
+
+
+def stage_serialize(grid, frames):
+    """Figure JSON serialization"""
+    fig = build_figure(grid, frames)
+    return lambda: fig.to_json()
+
+
+def stage_figure_spec(grid, frames):
+    """Plain-dict figure streamed to JSON: frames built and serialized without validation"""
+    spec = sphere_animation(grid, frames).figure_spec()
+    return lambda: spec.write_json(os.devnull)
+
+
+def stage_rasterize(grid):
+    """write_image rasterization of a single 900x900 frame"""
+    fig = build_figure(grid, 1)
+    fig.frames = []
+    fig.update_layout(width=900, height=900)
+    # Fails here, during setup, when Kaleido or Chrome is unavailable
+    fig.to_image(format='png')
+    return lambda: fig.to_image(format='png')
+
+
+def stage_rasterize_numpy(grid):
+    """NumPy z-buffer rasterization of a single 900x900 frame"""
+    animation = sphere_animation(grid, 1)
+    rasterizer = animation.rasterizer()
+    surfaces = animation.surfaces(*animation.compute_frame(0))
+    return lambda: rasterizer.render(surfaces)
+
+
+def stage_sampling(particles):
+    """Double-slit trajectory generation in one process (far-field table built in setup)"""
+    import double_slit_experiment as ds
+
+    pattern = ds.intensity_pattern()
+    seed_sequence = np.random.SeedSequence(0)
+    return lambda: ds.generate_chunk(particles, seed_sequence, pattern=pattern)
+
+
+STAGES = {
+    'harmonics': (stage_harmonics, ['grid']),
+    'geometry': (stage_geometry, ['grid', 'frames']),
+    'geometry_batched': (stage_geometry_batched, ['grid', 'frames']),
+    'frames': (stage_frames, ['grid', 'frames']),
+    'serialize': (stage_serialize, ['grid', 'frames']),
+    'figure_spec': (stage_figure_spec, ['grid', 'frames']),
+    'rasterize': (stage_rasterize, ['grid']),
+    'rasterize_numpy': (stage_rasterize_numpy, ['grid']),
+    'sampling': (stage_sampling, ['particles']),
+}
+
+
+def size_combinations(params, sizes):
+    """Every combination of the given size parameters"""
+    combos = [{}]
+    for param in params:
+        combos = [dict(combo, **{param: value}) for combo in combos for value in sizes[param]]
+    return combos
+
+
+def run_case(stage, size, repeat):
+    """Time one stage at one size: best/mean seconds and peak traced memory"""
+    setup, _ = STAGES[stage]
+    try:
+        run = setup(**size)
+    except (RuntimeError, ImportError, ValueError) as e:
+        return {'skipped': str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__}
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    # Separate run for memory so tracing overhead does not skew the timings
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'best_s': min(times), 'mean_s': sum(times) / len(times), 'peak_mb': peak / 1e6}
+
+
+def case_key(stage, size):
+    """Stable name of a benchmark case, e.g. 'frames[grid=150,frames=60]'"""
+    return f"{stage}[{','.join(f'{k}={v}' for k, v in size.items())}]"
+
+
+def compare(results, baseline, threshold):
+    """Return the cases whose best time regressed by more than threshold"""
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if not reference or 'best_s' not in result or 'best_s' not in reference:
+            continue
+        ratio = result['best_s'] / reference['best_s']
+        result['baseline_ratio'] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((key, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the render pipeline stages')
+    parser.add_argument('--quick', action='store_true', help='only run the small problem sizes')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma-separated stages to run')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (best is kept)')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write results')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown versus the baseline (0.2 = 20%%)')
+    parser.add_argument('--save-baseline', action='store_true', help='also store the results as the baseline')
+    args = parser.parse_args(argv)
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    results = {}
+    for stage in args.stages.split(','):
+        if stage not in STAGES:
+            parser.error(f"unknown stage {stage!r}, choose from {', '.join(STAGES)}")
+        for size in size_combinations(STAGES[stage][1], sizes):
+            key = case_key(stage, size)
+            results[key] = dict(stage=stage, size=size, **run_case(stage, size, args.repeat))
+            result = results[key]
+            if 'skipped' in result:
+                print(f"{key:45s} skipped: {result['skipped']}")
+            else:
+                print(f"{key:45s} best {result['best_s'] * 1e3:10.2f} ms   "
+                      f"mean {result['mean_s'] * 1e3:10.2f} ms   peak {result['peak_mb']:8.1f} MB")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        for key, ratio in regressions:
+            print(f"REGRESSION {key}: {ratio:.2f}x baseline")
+        if not regressions:
+            print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+
+    report = {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,304 @@
+import argparse
+import sys
+
+# Command-line entry point for headless jobs. Only argparse is imported up
+# front; numpy, plotly, scipy, PIL and kaleido load when a scene is built.
+#
+#   python cli.py preview superposition --mode client
+#   python cli.py preview double-slit --html double_slit.html
+#   python cli.py preview superposition --json spheres.json
+#   python cli.py export superposition --output spheres.mp4 --workers 8
+#   python cli.py export superposition --renderer numpy
+#   python cli.py export double-slit --mode png --crop auto
+#   python cli.py preview double-slit --particles 10000000 --display density
+#   python cli.py export double-slit --particles 10000000 --seed 1 --trajectories particles.npy --display density
+#   python cli.py sweep --param amplitude=0.3,0.5 --param 'm_values=[3],[2,-2]'
+#   python cli.py serve superposition --port 8050
+#   python cli.py export superposition --waves waves.json --renderer numpy
+
+SCENES = ['superposition', 'double-slit']
+
+
+def parse_crop(value):
+    """'auto', 'none', or top,bottom,left,right margins in pixels"""
+    if value == 'auto':
+        return 'auto'
+    if value == 'none':
+        return None
+    try:
+        margins = tuple(int(v) for v in value.split(','))
+    except ValueError:
+        margins = ()
+    if len(margins) != 4:
+        raise argparse.ArgumentTypeError("expected 'auto', 'none' or top,bottom,left,right")
+    return margins
+
+
+def build_instrument(args):
+    """Instrumentation for the run, enabled by --report"""
+    from instrumentation import Instrumentation
+
+    return Instrumentation(enabled=args.report is not None, profile=args.profile,
+                           trace_memory=args.trace_memory)
+
+
+def load_trajectories(args):
+    """Double-slit trajectories from --trajectories, generated into that file first if it is missing"""
+    import os
+
+    import double_slit_experiment as ds
+
+    if args.trajectories is None:
+        return None
+    if not os.path.exists(args.trajectories):
+        ds.generate_trajectories(args.particles or ds.n_particles, args.seed, path=args.trajectories)
+        print(f"Trajectories written to {args.trajectories}")
+    return ds.load_trajectories(args.trajectories)
+
+
+def load_waves(args):
+    """Wave components from the --waves JSON file, or None for the default two waves"""
+    import json
+
+    if args.waves is None:
+        return None
+    with open(args.waves) as f:
+        return json.load(f)
+
+
+def lod_options(args):
+    """SphereAnimation level-of-detail arguments given on the command line"""
+    options = {}
+    if args.target_pixels is not None:
+        options['target_pixels'] = args.target_pixels
+    if args.max_error_px is not None:
+        options['max_error_px'] = args.max_error_px
+    return options
+
+
+def run_preview(args):
+    """Show a scene in the browser, or write it to --html or --json without opening one"""
+    open_browser = args.html is None
+    if args.scene == 'superposition':
+        import superposition
+
+        animation = superposition.SphereAnimation(grid_resolution=args.grid or superposition.grid_resolution,
+                                                  num_frames=args.frames or superposition.num_frames,
+                                                  waves=load_waves(args), **lod_options(args))
+        if args.json:
+            animation.figure_spec().write_json(args.json)
+            print(f"Figure JSON written to {args.json}")
+            return
+        superposition.preview(animation, mode=args.mode, float32_payload=args.float32,
+                              html_path=args.html or superposition.html_path, open_browser=open_browser)
+    else:
+        import double_slit_experiment as ds
+
+        fig = ds.figure_spec(n_particles=args.particles or ds.n_particles, n_frames=args.frames or ds.n_frames,
+                             trajectories=load_trajectories(args), seed=args.seed,
+                             mode=args.display or ds.display_mode)
+        if args.json:
+            fig.write_json(args.json)
+            print(f"Figure JSON written to {args.json}")
+            return
+        ds.preview(fig, float32_payload=args.float32, html_path=args.html, open_browser=open_browser)
+
+
+def parse_param(value):
+    """name=v1,v2,... with JSON values, e.g. amplitude=0.3,0.5 or m_values=[3],[2,-2]"""
+    import json
+
+    name, sep, values = value.partition('=')
+    try:
+        values = json.loads(f'[{values}]')
+    except ValueError:
+        values = []
+    if not sep or not values:
+        raise argparse.ArgumentTypeError("expected name=value,value,... with JSON values")
+    return name, values
+
+
+def run_sweep(args):
+    """Render one superposition video per parameter combination"""
+    import sweep
+
+    if args.configs:
+        configs = sweep.load_configs(args.configs)
+    else:
+        configs = sweep.expand_grid(dict(args.param) if args.param else sweep.sweep_grid)
+    overrides = {'num_frames': args.frames, 'grid_resolution': args.grid, **lod_options(args)}
+    if any(overrides.values()):
+        configs = [{**config, **{k: v for k, v in overrides.items() if v and k not in config}}
+                   for config in configs]
+    instrument = build_instrument(args)
+    with instrument.span('sweep'):
+        sweep.run_sweep(configs, output_dir=args.output_dir, renderer=args.renderer, workers=args.workers,
+                        frame_cache_dir=None if args.no_frame_cache else sweep.frame_cache_dir,
+                        framerate=args.framerate or sweep.framerate,
+                        crf=sweep.crf if args.crf is None else args.crf, crop=args.crop,
+                        instrument=instrument)
+    instrument.write_report(args.report)
+
+
+def run_serve(args):
+    """Preview a scene from a local server that computes frames on demand"""
+    import preview_server
+
+    if args.scene == 'superposition':
+        import superposition
+
+        animation = superposition.SphereAnimation(grid_resolution=args.grid or superposition.grid_resolution,
+                                                  num_frames=args.frames or superposition.num_frames,
+                                                  waves=load_waves(args), **lod_options(args))
+        build, params = preview_server.sphere_scene(animation)
+    else:
+        import double_slit_experiment as ds
+
+        build, params = preview_server.double_slit_scene(args.particles or ds.n_particles,
+                                                         args.frames or ds.n_frames, seed=args.seed,
+                                                         mode=args.display or ds.display_mode)
+    preview_server.serve(build, params, host=args.host, port=args.port, cache_mb=args.cache_mb,
+                         prefetch=args.prefetch, open_browser=not args.no_browser)
+
+
+def run_export(args):
+    """Render a scene to video without opening a browser"""
+    instrument = build_instrument(args)
+    if args.scene == 'superposition':
+        import superposition
+
+        animation = superposition.SphereAnimation(grid_resolution=args.grid or superposition.grid_resolution,
+                                                  num_frames=args.frames or superposition.num_frames,
+                                                  waves=load_waves(args), **lod_options(args),
+                                                  instrument=instrument)
+        frame_cache_dir = None if args.no_frame_cache else superposition.frame_cache_dir
+        with instrument.span('export'):
+            superposition.export(animation, video_path=args.output or superposition.video_path,
+                                 export_mode=args.mode, framerate=args.framerate or superposition.framerate,
+                                 crf=superposition.crf if args.crf is None else args.crf,
+                                 crop=args.crop, workers=args.workers, frame_cache_dir=frame_cache_dir,
+                                 deduplicate=not args.no_deduplicate, renderer=args.renderer,
+                                 instrument=instrument)
+    else:
+        import double_slit_experiment as ds
+        import save_mp4
+
+        with instrument.span('figure'):
+            fig = ds.build_figure(n_particles=args.particles or ds.n_particles,
+                                  n_frames=args.frames or ds.n_frames, trajectories=load_trajectories(args),
+                                  seed=args.seed, mode=args.display or ds.display_mode)
+        # Trajectories read from a file are the same on every run, seeded or not
+        seeded = args.seed is not None or args.trajectories is not None
+        frame_cache_dir = None if args.no_frame_cache else save_mp4.frame_cache_for(seeded)
+        with instrument.span('export'):
+            save_mp4.export_animation(fig, video_path=args.output or save_mp4.video_path,
+                                      export_mode=args.mode, framerate=args.framerate or save_mp4.framerate,
+                                      crf=save_mp4.crf if args.crf is None else args.crf,
+                                      crop=args.crop, workers=args.workers, frame_cache_dir=frame_cache_dir,
+                                      instrument=instrument)
+    instrument.write_report(args.report)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Preview or export the animations')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    preview = commands.add_parser('preview', help='show a scene in the browser')
+    preview.add_argument('scene', choices=SCENES)
+    preview.add_argument('--mode', choices=['frames', 'client'], default='frames',
+                         help="superposition only: 'client' computes the frames in the browser")
+    preview.add_argument('--float32', action='store_true', help='send trace arrays as float32 typed arrays')
+    preview.add_argument('--html', help='write the preview to this file instead of opening a browser')
+    preview.add_argument('--json', help="write the figure JSON to this file instead (frames are streamed; "
+                                        "superposition ignores --mode)")
+
+    export = commands.add_parser('export', help='render a scene to MP4')
+    export.add_argument('scene', choices=SCENES)
+    export.add_argument('--output', help='video path (default: the scene module setting)')
+    export.add_argument('--mode', choices=['stream', 'png'], default='stream',
+                        help="'stream' pipes frames into ffmpeg, 'png' writes frames/")
+    export.add_argument('--framerate', type=int, help='frames per second of the video')
+    export.add_argument('--crf', type=int, help='x264 quality (lower is better)')
+    export.add_argument('--crop', type=parse_crop, default=None,
+                        help="'auto', 'none' or top,bottom,left,right margins in pixels")
+    export.add_argument('--workers', type=int, help='render processes (default: number of CPUs)')
+    export.add_argument('--no-frame-cache', action='store_true',
+                        help='render every frame instead of reusing renders with unchanged inputs')
+    export.add_argument('--no-deduplicate', action='store_true',
+                        help='superposition only: render repeated symmetric states separately')
+    export.add_argument('--renderer', choices=['plotly', 'numpy'], default='plotly',
+                        help="superposition only: 'numpy' rasterizes the surfaces without plotly "
+                             "(much faster, no axes or titles)")
+
+    sweep = commands.add_parser('sweep', help='render one superposition video per parameter combination')
+    sweep.add_argument('--param', action='append', type=parse_param, metavar='NAME=VALUES',
+                       help='SphereAnimation parameter and its comma-separated JSON values; '
+                            'every combination is rendered (repeatable)')
+    sweep.add_argument('--configs', help='JSON file with a {name: [values]} grid or a list of configurations')
+    sweep.add_argument('--output-dir', default='sweep', help='directory for the videos and index.json')
+    sweep.add_argument('--renderer', choices=['plotly', 'numpy'], default='plotly',
+                       help="'numpy' rasterizes the surfaces without plotly (much faster, no axes or titles)")
+    sweep.add_argument('--framerate', type=int, help='frames per second of the videos')
+    sweep.add_argument('--crf', type=int, help='x264 quality (lower is better)')
+    sweep.add_argument('--crop', type=parse_crop, default=None,
+                       help="'auto', 'none' or top,bottom,left,right margins in pixels")
+    sweep.add_argument('--workers', type=int, help='render processes shared by all jobs (default: number of CPUs)')
+    sweep.add_argument('--no-frame-cache', action='store_true',
+                       help='render every frame instead of reusing renders with unchanged inputs')
+    sweep.add_argument('--frames', type=int, help='number of animation frames, unless a configuration sets it')
+    sweep.add_argument('--grid', type=lambda v: v if v == 'auto' else int(v),
+                       help="grid points per axis, or 'auto', unless a configuration sets it")
+
+    serve = commands.add_parser('serve', help='preview a scene from a local server that computes frames on demand')
+    serve.add_argument('scene', choices=SCENES)
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    serve.add_argument('--port', type=int, default=8050, help='port to listen on (0 picks a free one)')
+    serve.add_argument('--cache-mb', type=float, default=512, help='size of the frame cache')
+    serve.add_argument('--prefetch', type=int, default=8, help='frames computed ahead of the one being viewed')
+    serve.add_argument('--no-browser', action='store_true', help='do not open the page in a browser')
+
+    for command in (preview, export, sweep, serve):
+        command.add_argument('--target-pixels', type=int,
+                             help="with --grid auto, rendered width the sphere mesh is sized for "
+                                  "(default: the export frame size)")
+        command.add_argument('--max-error-px', type=float,
+                             help='with --grid auto, allowed radial error of the sphere mesh in pixels')
+
+    for command in (export, sweep):
+        command.add_argument('--report', help='write per-stage timings to this JSON file')
+        command.add_argument('--profile', action='store_true', help='with --report, also capture a cProfile')
+        command.add_argument('--trace-memory', action='store_true',
+                             help='with --report, also record peak memory')
+
+    for command in (preview, export, serve):
+        command.add_argument('--frames', type=int, help='number of animation frames')
+        command.add_argument('--grid', type=lambda v: v if v == 'auto' else int(v),
+                             help="superposition only: grid points per axis, or 'auto'")
+        command.add_argument('--waves', metavar='PATH',
+                             help='superposition only: JSON list of wave components, each with terms '
+                                  '([[l, m], ...]) and optionally amplitude, phase, frequency and spin')
+        command.add_argument('--particles', type=int, help='double-slit only: number of particles')
+        command.add_argument('--seed', type=int, help='double-slit only: random seed for the trajectories')
+        command.add_argument('--display', choices=['markers', 'density'],
+                             help="double-slit only: 'density' shows landed hits as a histogram on the screen "
+                                  "(for very large --particles)")
+
+    for command in (preview, export):
+        command.add_argument('--trajectories', metavar='PATH',
+                             help='double-slit only: memory-mapped .npy trajectory file, generated with '
+                                  '--particles/--seed if it does not exist and reused as is if it does')
+
+    args = parser.parse_args(argv)
+    if args.command == 'preview':
+        run_preview(args)
+    elif args.command == 'sweep':
+        run_sweep(args)
+    elif args.command == 'serve':
+        run_serve(args)
+    else:
+        run_export(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
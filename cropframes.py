@@ -1,48 +1,172 @@
 from PIL import Image
+import numpy as np
+import hashlib
+import json
+import multiprocessing
 import os
 import glob
+import time
 
-# Create output directory for cropped frames
-if not os.path.exists('frames_cropped'):
-    os.makedirs('frames_cropped')
+from video_export import AutoCrop, FFmpegWriter
 
-# Get all frame files
-frame_files = sorted(glob.glob('frames/frame_*.png'))
+# Output mode: 'png' writes frames_cropped/, 'stream' pipes the cropped
+# frames straight into ffmpeg without a second directory
+output_mode = 'png'
+video_path = 'spheres_animation_cropped.mp4'
+framerate = 20
+crf = 18
 
-print(f"Found {len(frame_files)} frames to crop")
+# Batch settings
+workers = os.cpu_count()  # processes decoding, cropping and encoding frames
+output_format = 'png'  # 'png', or an uncompressed format such as 'bmp' or 'tiff' for speed
+png_compress_level = 6  # 0 (fastest, largest) to 9 (slowest, smallest)
+skip_unchanged = True  # skip frames whose source and crop match the manifest
+manifest_path = 'frames_cropped/manifest.json'
+manifest_flush_seconds = 5  # rewrite the manifest this often while cropping, so an interrupted batch keeps its progress
 
 # Crop parameters
+crop_mode = 'fixed'  # 'fixed' uses the margins below, 'auto' the union bounding box of all frames
 crop_top = 250
 crop_bottom = 250
 crop_left = 200
 crop_right = 200
+crop_background = [(255, 255, 255), (240, 240, 240)]  # colours ignored by crop_mode = 'auto'
 
-# Process each frame
-for i, frame_path in enumerate(frame_files):
-    # Open the image
+
+def file_digest(path):
+    """SHA-1 of a file's contents"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def source_signature(path):
+    """Cheap change detection: modification time and size of a source frame"""
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def is_unchanged(entry, frame_path, output_path, settings):
+    """Check a manifest entry against the current source, output and crop settings"""
+    if entry is None or entry.get('settings') != settings or not os.path.exists(output_path):
+        return False
+    signature = source_signature(frame_path)
+    if all(entry.get(key) == value for key, value in signature.items()):
+        return True
+    # Touched but identical sources (e.g. a re-render) still count as unchanged
+    if entry.get('sha1') == file_digest(frame_path):
+        entry.update(signature)
+        return True
+    return False
+
+
+def write_manifest(manifest, path=manifest_path):
+    """Replace the manifest file atomically, so an interruption never leaves it half written"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def frame_content(frame_path):
+    """AutoCrop box of a single frame (runs in a worker)"""
+    auto_crop = AutoCrop(background=crop_background)
+    auto_crop.update(np.asarray(Image.open(frame_path).convert('RGB')))
+    return auto_crop
+
+
+def crop_image(frame_path, margins):
+    """Open a frame and crop it by (top, bottom, left, right) margins"""
     img = Image.open(frame_path)
-    
-    # Get original dimensions
+    top, bottom, left, right = margins
     width, height = img.size
-    
+
     # Calculate crop box (left, upper, right, lower)
-    crop_box = (
-        crop_left,                    # left
-        crop_top,                     # top
-        width - crop_right,           # right
-        height - crop_bottom          # bottom
-    )
-    
-    # Crop the image
-    img_cropped = img.crop(crop_box)
-    
+    crop_box = (left, top, width - right, height - bottom)
+    return img, img.crop(crop_box)
+
+
+def crop_to_array(job):
+    """Cropped RGB array of one frame (runs in a worker)"""
+    frame_path, margins = job
+    return np.asarray(crop_image(frame_path, margins)[1].convert('RGB'))
+
+
+def crop_to_file(job):
+    """Crop one frame to disk and return its manifest entry (runs in a worker)"""
+    frame_path, output_path, margins, settings = job
+    img, img_cropped = crop_image(frame_path, margins)
+
     # Save cropped image
-    output_path = f'frames_cropped/frame_{i:03d}.png'
-    img_cropped.save(output_path)
-    
-    print(f"Cropped frame {i+1}/{len(frame_files)}: {img.size} -> {img_cropped.size}")
-
-print("\n✓ All frames cropped successfully!")
-print(f"Cropped dimensions: {img_cropped.size}")
-print("\nTo create video from cropped frames, run:")
-print("ffmpeg -r 20 -i frames_cropped/frame_%03d.png -vcodec libx264 -pix_fmt yuv420p -crf 18 spheres_animation_cropped.mp4")
\ No newline at end of file
+    options = {'compress_level': png_compress_level} if output_format == 'png' else {}
+    img_cropped.save(output_path, format=output_format.upper(), **options)
+
+    entry = source_signature(frame_path)
+    entry.update(sha1=file_digest(frame_path), settings=settings,
+                 source_size=list(img.size), cropped_size=list(img_cropped.size))
+    return output_path, entry
+
+
+if __name__ == '__main__':
+    # Get all frame files
+    frame_files = sorted(glob.glob('frames/frame_*.png'))
+
+    print(f"Found {len(frame_files)} frames to crop")
+
+    with multiprocessing.Pool(workers) as pool:
+        if crop_mode == 'auto':
+            # One box covering the content of every frame, so the crop never jitters
+            auto_crop = AutoCrop(background=crop_background)
+            for frame_box in pool.imap_unordered(frame_content, frame_files, chunksize=4):
+                auto_crop.merge(frame_box)
+            crop_top, crop_bottom, crop_left, crop_right = auto_crop.margins()
+            print(f"Auto-crop margins: top={crop_top} bottom={crop_bottom} left={crop_left} right={crop_right}")
+        margins = (crop_top, crop_bottom, crop_left, crop_right)
+
+        if output_mode == 'stream':
+            # Crop in the workers and encode directly, in frame order
+            jobs = [(frame_path, margins) for frame_path in frame_files]
+            with FFmpegWriter(video_path, framerate=framerate, crf=crf) as writer:
+                for i, frame in enumerate(pool.imap(crop_to_array, jobs, chunksize=4)):
+                    writer.write(frame)
+                    print(f"Encoded frame {i+1}/{len(frame_files)}")
+
+            print(f"\n✓ MP4 video created: {video_path}")
+        else:
+            # Create output directory for cropped frames
+            if not os.path.exists('frames_cropped'):
+                os.makedirs('frames_cropped')
+
+            manifest = {}
+            if skip_unchanged and os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+
+            # Only frames that are new, edited, or cropped differently are processed
+            settings = {'margins': list(margins), 'format': output_format,
+                        'compress_level': png_compress_level if output_format == 'png' else None}
+            jobs = []
+            for i, frame_path in enumerate(frame_files):
+                output_path = f'frames_cropped/frame_{i:03d}.{output_format}'
+                if skip_unchanged and is_unchanged(manifest.get(output_path), frame_path, output_path, settings):
+                    continue
+                jobs.append((frame_path, output_path, margins, settings))
+            print(f"Skipping {len(frame_files) - len(jobs)} unchanged frames")
+
+            # Process the remaining frames in parallel. The manifest is
+            # flushed as crops complete, and once more however the loop
+            # ends, so a rerun after a crash only redoes unfinished frames
+            flushed = time.monotonic()
+            try:
+                for done, (output_path, entry) in enumerate(pool.imap_unordered(crop_to_file, jobs), 1):
+                    manifest[output_path] = entry
+                    print(f"Cropped {output_path} ({done}/{len(jobs)}): "
+                          f"{tuple(entry['source_size'])} -> {tuple(entry['cropped_size'])}")
+                    if time.monotonic() - flushed >= manifest_flush_seconds:
+                        write_manifest(manifest)
+                        flushed = time.monotonic()
+            finally:
+                write_manifest(manifest)
+
+            print("\n✓ All frames cropped successfully!")
+            print("\nTo create video from cropped frames, run:")
+            print(f"ffmpeg -r {framerate} -i frames_cropped/frame_%03d.{output_format} -vcodec libx264 -pix_fmt yuv420p -crf {crf} {video_path}")
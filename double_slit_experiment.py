@@ -1,9 +1,14 @@
-import plotly.graph_objects as go
+import os
+
 import numpy as np
 
+# Importing this module is cheap: plotly is only loaded when the figure is
+# built. Run it directly, or use `python cli.py preview|export double-slit`.
+
 # Parameters
 n_particles = 1500
 n_frames = 60
+random_seed = None  # set to an int for reproducible trajectories (lets cached video frames be reused)
 source_x = 0
 slit_x = 5
 screen_x = 10
@@ -11,279 +16,434 @@ screen_x = 10
 # Slit positions
 slit1_y = 2
 slit2_y = -2
-slit_width = 0.4
+slit_width = 0.4  # half-width of each opening in the barrier
+
+# Slits as (center y, opening width); any number of slits works, e.g. a
+# grating: from far_field import grating; slits = grating(8, pitch=1.0, width=0.3)
+slits = [(slit1_y, 2 * slit_width), (slit2_y, 2 * slit_width)]
+
+# Detection screen extent
+screen_y_range = (-5, 5)
+screen_z_range = (-3, 3)
+
+# Display: 'markers' draws every particle; 'density' shows landed hits as a
+# histogram on the screen and only a sample of the particles in flight, so
+# the figure costs the same for 10^4 or 10^7 particles
+display_mode = 'markers'
+density_bins = (120, 72)  # screen histogram bins along y and z
+max_markers = 20_000  # most in-flight markers per frame in density mode
+
+# Interference parameters
+wavelength = 0.8  # Arbitrary wavelength
+L = screen_x - slit_x  # Distance from slits to screen
+
+# Particle generation: particles are drawn in chunks of chunk_size, each
+# from its own Generator spawned from the seed's SeedSequence, so the
+# trajectories depend on the seed and chunk_size only, never on how many
+# processes generate them
+generation_workers = os.cpu_count()  # processes generating chunks
+chunk_size = 250_000
+trajectory_path = None  # e.g. 'trajectories.npy': generate into a memory-mapped file instead of RAM
 
-# Choose which slit a particle goes through
-def choose_slit():
-    return slit1_y if np.random.random() < 0.5 else slit2_y
+# Choose which slit each particle goes through
+def choose_slits(n, slits=slits, random=np.random):
+    """Pick a slit center for each of n particles, weighted by the slit widths"""
+    centers = np.array([center for center, _ in slits])
+    widths = np.array([width for _, width in slits])
+    cumulative = np.cumsum(widths) / widths.sum()
+    return centers[np.minimum(np.searchsorted(cumulative, random.random(n), side='right'), len(centers) - 1)]
+
+# Far-field intensity of the slits
+def intensity_pattern(slits=slits, half_width=4, table_size=4096):
+    """FarFieldPattern of the slits over the screen window"""
+    from far_field import FarFieldPattern
+
+    return FarFieldPattern(slits, wavelength, L, half_width=half_width, table_size=table_size)
+
+# Sample landing positions from the interference pattern
+def sample_landing_y(n, pattern=None, random=np.random):
+    """Draw n screen positions from the slits' far-field intensity (no rejection)"""
+    if pattern is None:
+        pattern = intensity_pattern()
+    return pattern.sample(n, random)
+
+# Generate one chunk of trajectories from its own random stream
+def generate_chunk(n, seed_sequence, slits=slits, pattern=None):
+    """Return (n, 3 waypoints, xyz) trajectories: source, slit and screen"""
+    random = np.random.default_rng(seed_sequence)
+    if pattern is None:
+        pattern = intensity_pattern(slits)
 
-# Generate trajectories for each particle
-trajectories = []
-for i in range(n_particles):
     # All electrons start from single origin
     start_y = 0
     start_z = 0
-    
-    # Choose slit
-    slit_y = choose_slit()
-    slit_z = np.random.uniform(-slit_width, slit_width)
-    
-    # Calculate interference pattern on screen
-    # The interference pattern appears in the Y direction (perpendicular to slit separation)
-    wavelength = 0.8  # Arbitrary wavelength
-    d = abs(slit1_y - slit2_y)  # Distance between slits (separation in Y)
-    L = screen_x - slit_x  # Distance from slits to screen
-    
-    # For interference fringes in Y direction:
-    # Position of bright fringes: y = m * λ * L / d
-    # where m is the order number
-    
-    # Generate position based on interference probability
-    # Sample from interference intensity distribution
-    y_center = (slit1_y + slit2_y) / 2  # Center between slits
-    
-    # Create weighted random position based on interference intensity
-    # Intensity = cos²(π * d * y / (λ * L))
-    attempts = 0
-    max_attempts = 100
-    while attempts < max_attempts:
-        # Random y position on screen
-        y_candidate = np.random.uniform(y_center - 4, y_center + 4)
-        
-        # Calculate intensity at this position
-        intensity = np.cos(np.pi * d * (y_candidate - y_center) / (wavelength * L)) ** 2
-        
-        # Accept position with probability proportional to intensity
-        if np.random.random() < intensity:
-            final_y = y_candidate
-            break
-        attempts += 1
+
+    # Landing positions follow the far-field pattern of the slits: for two
+    # slits, bright fringes at y = m * λ * L / d under a single-slit envelope
+    slit_ys = choose_slits(n, slits, random)
+    slit_zs = random.uniform(-slit_width, slit_width, n)
+    final_ys = sample_landing_y(n, pattern, random)
+    final_zs = random.normal(0, 0.3, n)
+
+    # Trajectories in 3 segments, stored as (particle, waypoint, xyz):
+    # waypoint 0 = source, 1 = slit, 2 = screen
+    trajectories = np.empty((n, 3, 3))
+    trajectories[:, :, 0] = [source_x, slit_x, screen_x]
+    trajectories[:, :, 1] = np.column_stack([np.full(n, start_y), slit_ys, final_ys])
+    trajectories[:, :, 2] = np.column_stack([np.full(n, start_z), slit_zs, final_zs])
+    return trajectories
+
+# Pool entry point
+def _generate_chunk(task):
+    """generate_chunk(*task)"""
+    return generate_chunk(*task)
+
+# Generate all trajectories, chunk by chunk
+def generate_trajectories(n=n_particles, seed=random_seed, slits=slits, workers=generation_workers,
+                          chunk_size=chunk_size, path=trajectory_path):
+    """Return (n, 3 waypoints, xyz) trajectories: source, slit and screen
+
+    The same seed and chunk_size give bit-identical trajectories for any
+    number of workers. With a path, the chunks are written to a .npy file
+    as they arrive and the result is memory-mapped, so n is not limited by
+    RAM; load it again with load_trajectories(path).
+    """
+    pattern = intensity_pattern(slits)
+    sizes = [min(chunk_size, n - start) for start in range(0, n, chunk_size)]
+    tasks = [(size, seed_sequence, slits, pattern)
+             for size, seed_sequence in zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))]
+
+    if path is None:
+        trajectories = np.empty((n, 3, 3))
+    else:
+        trajectories = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n, 3, 3))
+    if workers == 1 or len(tasks) < 2:
+        chunks = map(_generate_chunk, tasks)
+        pool = None
     else:
-        # Fallback if no position accepted
-        final_y = y_center
-    
-    final_z = np.random.normal(0, 0.3)
-    
-    # Trajectory in 3 segments
-    trajectory = {
-        'x': [source_x, slit_x, screen_x],
-        'y': [start_y, slit_y, final_y],
-        'z': [start_z, slit_z, final_z],
-        'slit': slit_y
-    }
-    trajectories.append(trajectory)
-
-# Create animation frames
-frames = []
-for frame_idx in range(n_frames):
-    n_visible = int((frame_idx + 1) / n_frames * n_particles)
-    
-    x_coords = []
-    y_coords = []
-    z_coords = []
-    colors = []
-    
-    for i in range(n_visible):
-        traj = trajectories[i]
-        progress = min(1.0, (frame_idx + 1) / n_frames + i / n_particles)
-        
-        if progress < 0.33:
-            # Before slit
-            t = progress / 0.33
-            x = source_x + t * (slit_x - source_x)
-            y = traj['y'][0] + t * (traj['y'][1] - traj['y'][0])
-            z = traj['z'][0] + t * (traj['z'][1] - traj['z'][0])
-        elif progress < 0.66:
-            # Between slit and screen
-            t = (progress - 0.33) / 0.33
-            x = slit_x + t * (screen_x - slit_x)
-            y = traj['y'][1] + t * (traj['y'][2] - traj['y'][1])
-            z = traj['z'][1] + t * (traj['z'][2] - traj['z'][1])
+        import multiprocessing
+        pool = multiprocessing.Pool(min(workers or os.cpu_count(), len(tasks)))
+        chunks = pool.imap(_generate_chunk, tasks)
+    try:
+        start = 0
+        for chunk in chunks:
+            trajectories[start:start + len(chunk)] = chunk
+            start += len(chunk)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    if path is not None:
+        trajectories.flush()
+    return trajectories
+
+# Trajectories written by generate_trajectories(path=...)
+def load_trajectories(path):
+    """Memory-map a trajectory file; frames only read the particles they show"""
+    return np.load(path, mmap_mode='r')
+
+# Positions along the three-waypoint trajectories
+def trajectory_positions(traj, progress):
+    """Return the (n, 3) positions of n trajectories at the given progress values"""
+    # Before slit (segment 0 -> 1), between slit and screen (1 -> 2), on screen
+    before_slit = progress < 0.33
+    on_screen = progress >= 0.66
+    t = np.where(before_slit, progress / 0.33, np.clip((progress - 0.33) / 0.33, 0, 1))
+
+    start = np.where(before_slit[:, None], traj[:, 0], traj[:, 1])
+    end = np.where(before_slit[:, None], traj[:, 1], traj[:, 2])
+    positions = start + t[:, None] * (end - start)
+    return np.where(on_screen[:, None], traj[:, 2], positions)
+
+# The visible particles on the screen are always one contiguous index range
+def landed_range(n_particles, frame_idx, n_frames=n_frames):
+    """Return (first, stop): particles first..stop-1 are on the screen in the frame, 0..first-1 in flight"""
+    elapsed = (frame_idx + 1) / n_frames
+    stop = int(elapsed * n_particles)
+    first = int(np.clip(np.ceil((0.66 - elapsed) * n_particles), 0, stop))
+    # Settle rounding with the exact progress test the frames use
+    while first > 0 and min(1.0, elapsed + (first - 1) / n_particles) >= 0.66:
+        first -= 1
+    while first < stop and min(1.0, elapsed + first / n_particles) < 0.66:
+        first += 1
+    return first, stop
+
+# The particles that reach the screen in each frame
+def landing_ranges(n_particles, n_frames=n_frames):
+    """Yield (frame_idx, ranges): the (start, stop) index ranges of the particles landing in the frame"""
+    landed = (0, 0)
+    for frame_idx in range(n_frames):
+        first, stop = landed_range(n_particles, frame_idx, n_frames)
+        # The landed range only grows, so each frame adds at most two slices
+        new = [(first, stop)] if landed[0] == landed[1] else [(first, landed[0]), (landed[1], stop)]
+        yield frame_idx, [(start, end) for start, end in new if end > start]
+        landed = (first, stop)
+
+# Screen positions of the particles in index ranges, read one range at a time
+def screen_points(trajectories, ranges):
+    """Return the (n, 3) landing positions of the particles in the (start, stop) ranges"""
+    return np.concatenate([trajectories[start:stop, 2] for start, stop in ranges] + [np.empty((0, 3))])
+
+# Hit counts on the detection screen, accumulated frame by frame
+def screen_density(trajectories, n_frames=n_frames, bins=density_bins):
+    """Return the cumulative (z bins, y bins) counts of landed particles for every frame
+
+    Trajectories are read chunk_size particles at a time, so memory-mapped
+    trajectories need not fit in RAM.
+    """
+    n_y, n_z = bins
+    (y_low, y_high), (z_low, z_high) = screen_y_range, screen_z_range
+    counts = np.zeros(n_y * n_z + 1, dtype=np.int64)
+    densities = []
+    for frame_idx, ranges in landing_ranges(len(trajectories), n_frames):
+        for start, stop in ranges:
+            for low in range(start, stop, chunk_size):
+                hits = trajectories[low:min(low + chunk_size, stop), 2]
+                iy = np.floor((hits[:, 1] - y_low) / (y_high - y_low) * n_y)
+                iz = np.floor((hits[:, 2] - z_low) / (z_high - z_low) * n_z)
+                # Hits off the screen go to an extra bin that is dropped
+                outside = (iy < 0) | (iy >= n_y) | (iz < 0) | (iz >= n_z)
+                flat = np.where(outside, n_y * n_z, iz * n_y + iy).astype(np.int64)
+                counts += np.bincount(flat, minlength=counts.size)
+        densities.append(counts[:-1].reshape(n_z, n_y).copy())
+    return densities
+
+# Build the interactive figure as plain dicts
+def figure_spec(n_particles=n_particles, n_frames=n_frames, trajectories=None, seed=random_seed,
+                slits=slits, mode=display_mode):
+    """Animated figure of the particles with the barrier and the screen, as a FigureSpec
+
+    mode is 'markers' (every particle) or 'density' (screen hit histogram
+    and at most max_markers particles in flight). Frames are built while
+    the spec is written (or when spec.frames[i] is read), reading only the
+    particles they show.
+    """
+    from figure_writer import FigureSpec, LazyFrames
+
+    if trajectories is None:
+        trajectories = generate_trajectories(n_particles, seed, slits)
+    n_particles = len(trajectories)
+
+    # Particles still in flight form trace 0, which every frame replaces.
+    # Marker properties are scalars shared by every point
+    marker = dict(size=1, color='rgb(255, 69, 0)', opacity=0.7)
+    if mode == 'density':
+        # Landed particles only add to the screen's hit counts, and every
+        # stride-th particle in flight is drawn
+        densities = screen_density(trajectories, n_frames)
+        peak_in_flight = max(landed_range(n_particles, f, n_frames)[0] for f in range(n_frames))
+        stride = max(1, -(-peak_in_flight // max_markers))
+        landings = []
+    else:
+        # Particles landing in frame f form trace 1 + (index of f in
+        # batches): these are sent once with the figure and frames only
+        # switch them on, so the payload grows with the in-flight particles
+        # rather than all visible ones
+        stride = 1
+        landings = [(f, ranges) for f, ranges in landing_ranges(n_particles, n_frames) if ranges]
+    batches = [f for f, _ in landings]
+    landed_traces = list(range(1, len(batches) + 1))
+    # After the particles come one barrier section per gap, then the screen
+    screen_trace = 1 + len(batches) + len(slits) + 1
+
+    # Animation frames
+    def frame(frame_idx):
+        # Particles 0..first-1 are in flight: only those are read
+        first, _ = landed_range(n_particles, frame_idx, n_frames)
+        sample = np.arange(0, first, stride)
+        progress = np.minimum(1.0, (frame_idx + 1) / n_frames + sample / n_particles)
+        in_flight = trajectory_positions(trajectories[:first:stride], progress)
+        if mode == 'density':
+            updates = [dict(type='surface', surfacecolor=densities[frame_idx])]
+            update_traces = [screen_trace]
         else:
-            # On screen
-            x = screen_x
-            y = traj['y'][2]
-            z = traj['z'][2]
-        
-        x_coords.append(x)
-        y_coords.append(y)
-        z_coords.append(z)
-        colors.append('rgb(255, 69, 0)')
-    
-    frames.append(go.Frame(
-        data=[go.Scatter3d(
-            x=x_coords,
-            y=y_coords,
-            z=z_coords,
-            mode='markers',
-            marker=dict(size=1, color=colors, opacity=0.7),
-            name='Electrons'
-        )],
-        name=str(frame_idx)
-    ))
+            updates = [dict(type='scatter3d', visible=batch <= frame_idx) for batch in batches]
+            update_traces = landed_traces
 
-# Initial figure
-fig = go.Figure(
-    data=[go.Scatter3d(
+        return dict(
+            data=[dict(
+                type='scatter3d',
+                x=in_flight[:, 0],
+                y=in_flight[:, 1],
+                z=in_flight[:, 2]
+            )] + updates,
+            traces=[0] + update_traces,
+            name=str(frame_idx)
+        )
+
+    # Initial traces; the landed batches are read from the trajectories one
+    # index range at a time
+    data = [dict(
+        type='scatter3d',
         x=[], y=[], z=[],
         mode='markers',
-        marker=dict(size=1, opacity=0.7)
-    )],
-    frames=frames
-)
-
-# Add static elements - Barrier with slits
-# Top section of barrier (light blue)
-y_barrier = np.linspace(-5, slit2_y - slit_width, 20)
-z_barrier = np.linspace(-3, 3, 20)
-Y_top, Z_top = np.meshgrid(y_barrier, z_barrier)
-X_top = np.ones_like(Y_top) * slit_x
-
-fig.add_trace(go.Surface(
-    x=X_top, y=Y_top, z=Z_top,
-    colorscale=[[0, 'rgb(173, 216, 230)'], [1, 'rgb(173, 216, 230)']],
-    showscale=False,
-    opacity=0.8,
-    name='Barrier'
-))
-
-# Middle section of barrier (light blue)
-y_barrier_mid = np.linspace(slit2_y + slit_width, slit1_y - slit_width, 20)
-z_barrier_mid = np.linspace(-3, 3, 20)
-Y_mid, Z_mid = np.meshgrid(y_barrier_mid, z_barrier_mid)
-X_mid = np.ones_like(Y_mid) * slit_x
-
-fig.add_trace(go.Surface(
-    x=X_mid, y=Y_mid, z=Z_mid,
-    colorscale=[[0, 'rgb(173, 216, 230)'], [1, 'rgb(173, 216, 230)']],
-    showscale=False,
-    opacity=0.8,
-    showlegend=False
-))
-
-# Bottom section of barrier (light blue)
-y_barrier_bot = np.linspace(slit1_y + slit_width, 5, 20)
-z_barrier_bot = np.linspace(-3, 3, 20)
-Y_bot, Z_bot = np.meshgrid(y_barrier_bot, z_barrier_bot)
-X_bot = np.ones_like(Y_bot) * slit_x
-
-fig.add_trace(go.Surface(
-    x=X_bot, y=Y_bot, z=Z_bot,
-    colorscale=[[0, 'rgb(173, 216, 230)'], [1, 'rgb(173, 216, 230)']],
-    showscale=False,
-    opacity=0.8,
-    showlegend=False
-))
-
-# Detection screen
-y_screen = np.linspace(-5, 5, 30)
-z_screen = np.linspace(-3, 3, 30)
-Y_screen, Z_screen = np.meshgrid(y_screen, z_screen)
-X_screen = np.ones_like(Y_screen) * screen_x
-
-fig.add_trace(go.Surface(
-    x=X_screen, y=Y_screen, z=Z_screen,
-    colorscale=[[0, 'rgba(200,200,200,0.3)'], [1, 'rgba(200,200,200,0.3)']],
-    showscale=False,
-    opacity=0.3,
-    name='Screen'
-))
-
-# Layout configuration
-fig.update_layout(
-    title="Double-Slit Experiment - Wave-Particle Duality (3D)",
-    scene=dict(
-        xaxis=dict(range=[-2, 12], title="Distance"),
-        yaxis=dict(range=[-6, 6], title="Vertical Position"),
-        zaxis=dict(range=[-4, 4], title="Depth"),
-        camera=dict(
-            eye=dict(x=-1.5, y=-1.5, z=0.8)
+        marker=marker,
+        name='Electrons'
+    )]
+    for _, ranges in landings:
+        points = screen_points(trajectories, ranges)
+        data.append(dict(
+            type='scatter3d',
+            x=points[:, 0],
+            y=points[:, 1],
+            z=points[:, 2],
+            mode='markers',
+            marker=marker,
+            name='Electrons',
+            showlegend=False,
+            visible=False
+        ))
+
+    # Add static elements - Barrier with slits: one light blue section
+    # below, between and above the slit openings
+    openings = sorted((center - width / 2, center + width / 2) for center, width in slits)
+    section_edges = [-5] + [edge for opening in openings for edge in opening] + [5]
+    for k, (y_low, y_high) in enumerate(zip(section_edges[::2], section_edges[1::2])):
+        y_barrier = np.linspace(y_low, y_high, 20)
+        z_barrier = np.linspace(-3, 3, 20)
+        Y_section, Z_section = np.meshgrid(y_barrier, z_barrier)
+        X_section = np.ones_like(Y_section) * slit_x
+
+        data.append(dict(
+            type='surface',
+            x=X_section, y=Y_section, z=Z_section,
+            colorscale=[[0, 'rgb(173, 216, 230)'], [1, 'rgb(173, 216, 230)']],
+            showscale=False,
+            opacity=0.8,
+            **(dict(name='Barrier') if k == 0 else dict(showlegend=False))
+        ))
+
+    # Detection screen
+    if mode == 'density':
+        # One vertex per histogram bin centre, coloured by its hit count
+        n_y, n_z = density_bins
+        y_edges = np.linspace(*screen_y_range, n_y + 1)
+        z_edges = np.linspace(*screen_z_range, n_z + 1)
+        y_screen = (y_edges[1:] + y_edges[:-1]) / 2
+        z_screen = (z_edges[1:] + z_edges[:-1]) / 2
+        screen_color = dict(
+            surfacecolor=np.zeros((n_z, n_y), dtype=np.int64),
+            colorscale=[[0, 'rgb(235,235,235)'], [0.3, 'rgb(255, 160, 110)'], [1, 'rgb(255, 69, 0)']],
+            cmin=0,
+            cmax=max(int(densities[-1].max()), 1),
+            opacity=0.9
+        )
+    else:
+        y_screen = np.linspace(*screen_y_range, 30)
+        z_screen = np.linspace(*screen_z_range, 30)
+        screen_color = dict(
+            colorscale=[[0, 'rgba(200,200,200,0.3)'], [1, 'rgba(200,200,200,0.3)']],
+            opacity=0.3
+        )
+    Y_screen, Z_screen = np.meshgrid(y_screen, z_screen)
+    X_screen = np.ones_like(Y_screen) * screen_x
+
+    data.append(dict(
+        type='surface',
+        x=X_screen, y=Y_screen, z=Z_screen,
+        showscale=False,
+        name='Screen',
+        **screen_color
+    ))
+
+    # Layout configuration; titles are in the canonical {'text': ...} form
+    # since plain-dict figures are not validated
+    layout = dict(
+        title={'text': "Double-Slit Experiment - Wave-Particle Duality (3D)"},
+        scene=dict(
+            xaxis=dict(range=[-2, 12], title={'text': "Distance"}),
+            yaxis=dict(range=[-6, 6], title={'text': "Vertical Position"}),
+            zaxis=dict(range=[-4, 4], title={'text': "Depth"}),
+            camera=dict(
+                eye=dict(x=-1.5, y=-1.5, z=0.8)
+            ),
+            aspectmode='manual',
+            aspectratio=dict(x=2, y=1, z=0.8)
         ),
-        aspectmode='manual',
-        aspectratio=dict(x=2, y=1, z=0.8)
-    ),
-    updatemenus=[{
-        'type': 'buttons',
-        'showactive': False,
-        'y': 0.9,
-        'x': 0.1,
-        'buttons': [
-            {
-                'label': 'Play',
-                'method': 'animate',
-                'args': [None, {
-                    'frame': {'duration': 100, 'redraw': True},
-                    'fromcurrent': True,
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            },
-            {
-                'label': 'Pause',
-                'method': 'animate',
-                'args': [[None], {
-                    'frame': {'duration': 0, 'redraw': False},
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            }
-        ]
-    }],
-    sliders=[{
-        'active': 0,
-        'steps': [
-            {
-                'args': [[f.name], {
-                    'frame': {'duration': 0, 'redraw': True},
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }],
-                'label': str(k),
-                'method': 'animate'
-            }
-            for k, f in enumerate(fig.frames)
-        ],
-        'x': 0.1,
-        'len': 0.9,
-        'xanchor': 'left',
-        'y': 0,
-        'yanchor': 'top'
-    }],
-    width=1000,
-    height=700,
-    uirevision='constant'  # Preserves camera state
-)
-
-# Add JavaScript to update camera position in title
-fig.update_layout(
-    updatemenus=[{
-        'type': 'buttons',
-        'showactive': False,
-        'y': 0.9,
-        'x': 0.1,
-        'buttons': [
-            {
-                'label': 'Play',
-                'method': 'animate',
-                'args': [None, {
-                    'frame': {'duration': 100, 'redraw': True},
-                    'fromcurrent': True,
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            },
-            {
-                'label': 'Pause',
-                'method': 'animate',
-                'args': [[None], {
-                    'frame': {'duration': 0, 'redraw': False},
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            }
-        ]
-    }]
-)
-
-fig.show()
+        updatemenus=[{
+            'type': 'buttons',
+            'showactive': False,
+            'y': 0.9,
+            'x': 0.1,
+            'buttons': [
+                {
+                    'label': 'Play',
+                    'method': 'animate',
+                    'args': [None, {
+                        'frame': {'duration': 100, 'redraw': True},
+                        'fromcurrent': True,
+                        'mode': 'immediate',
+                        'transition': {'duration': 0}
+                    }]
+                },
+                {
+                    'label': 'Pause',
+                    'method': 'animate',
+                    'args': [[None], {
+                        'frame': {'duration': 0, 'redraw': False},
+                        'mode': 'immediate',
+                        'transition': {'duration': 0}
+                    }]
+                }
+            ]
+        }],
+        sliders=[{
+            'active': 0,
+            'steps': [
+                {
+                    'args': [[str(k)], {
+                        'frame': {'duration': 0, 'redraw': True},
+                        'mode': 'immediate',
+                        'transition': {'duration': 0}
+                    }],
+                    'label': str(k),
+                    'method': 'animate'
+                }
+                for k in range(n_frames)
+            ],
+            'x': 0.1,
+            'len': 0.9,
+            'xanchor': 'left',
+            'y': 0,
+            'yanchor': 'top'
+        }],
+        width=1000,
+        height=700,
+        uirevision='constant'  # Preserves camera state
+    )
+    return FigureSpec(data, layout, LazyFrames(frame, n_frames))
+
+# Build the interactive figure as a go.Figure (validated, for exports)
+def build_figure(n_particles=n_particles, n_frames=n_frames, trajectories=None, seed=random_seed,
+                 slits=slits, mode=display_mode):
+    """Animated go.Figure of the particles with the barrier and the screen (see figure_spec)"""
+    return figure_spec(n_particles, n_frames, trajectories, seed, slits, mode).to_figure()
+
+# Send trace arrays to the browser as float32 typed arrays
+float32_payload = False
+html_path = 'double_slit_experiment.html'
+
+def preview(fig, float32_payload=float32_payload, html_path=html_path, open_browser=True):
+    """Show the figure (a FigureSpec or go.Figure) in the browser, or with open_browser=False only write it to html_path"""
+    import plotly.io as pio
+    from figure_writer import FigureSpec
+
+    if float32_payload:
+        from figure_encoding import compact_figure
+        fig = compact_figure(fig)
+    if open_browser:
+        pio.show(fig, validate=False)
+    elif isinstance(fig, FigureSpec):
+        # Frames are serialized one at a time
+        fig.write_html(html_path)
+        print(f"Preview written to {html_path}")
+    else:
+        pio.write_html(fig, html_path, validate=False)
+        print(f"Preview written to {html_path}")
+
+def main():
+    """Build the animation and show it"""
+    preview(figure_spec())
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import numpy as np
+
+# Fraunhofer (far-field) diffraction of a 1D aperture made of any number
+# of slits. The aperture is sampled once on a fine grid and transformed
+# with one FFT; the intensity over the screen window is turned into an
+# inverse-CDF table, so drawing each particle's landing position is O(1).
+
+
+def grating(count, pitch, width, center=0.0):
+    """(center, width) of `count` equal slits spaced `pitch` apart around center"""
+    offsets = (np.arange(count) - (count - 1) / 2) * pitch
+    return [(center + offset, width) for offset in offsets]
+
+
+def aperture(y, slits, dy):
+    """Transmission of the slits on grid y with spacing dy
+
+    Each sample holds the fraction of its cell [y - dy/2, y + dy/2] that is
+    open, so slit edges need not fall on grid points.
+    """
+    transmission = np.zeros_like(y)
+    for center, width in slits:
+        low = np.maximum(y - dy / 2, center - width / 2)
+        high = np.minimum(y + dy / 2, center + width / 2)
+        transmission += np.clip(high - low, 0, None) / dy
+    return np.minimum(transmission, 1)
+
+
+class FarFieldPattern:
+    """Far-field intensity of a set of slits and an inverse-CDF table to sample it
+
+    slits is a list of (center, width) in the same units as the wavelength
+    and the slit-to-screen distance L. The pattern covers
+    center +- half_width on the screen (center defaults to the middle of
+    the slits).
+    """
+
+    def __init__(self, slits, wavelength, L, half_width=4, center=None,
+                 samples_per_slit=16, table_size=4096):
+        slits = [(float(c), float(w)) for c, w in slits]
+        if not slits:
+            raise ValueError("at least one slit is required")
+        if min(w for _, w in slits) <= 0:
+            raise ValueError("slit widths must be positive")
+        self.slits = slits
+        self.wavelength = wavelength
+        self.L = L
+        self.half_width = half_width
+        if center is None:
+            center = (min(c - w / 2 for c, w in slits) + max(c + w / 2 for c, w in slits)) / 2
+        self.center = center
+
+        # Aperture grid: fine enough to resolve the narrowest slit, and to
+        # reach the edge of the screen window (screen y = λ L f, Nyquist f = 1 / 2dy)
+        dy = min(min(w for _, w in slits) / samples_per_slit, wavelength * L / (4 * half_width))
+        low = min(c - w / 2 for c, w in slits) - dy
+        high = max(c + w / 2 for c, w in slits) + dy
+        n_aperture = int(np.ceil((high - low) / dy)) + 1
+
+        # Zero-padding sets the screen spacing λ L / (n dy); aim for a few
+        # FFT bins per table entry
+        screen_step = 2 * half_width / table_size
+        n = max(n_aperture, int(np.ceil(4 * wavelength * L / (dy * screen_step))))
+        n = 1 << (n - 1).bit_length()
+
+        y = low + dy * np.arange(n_aperture)
+        field = np.fft.rfft(aperture(y, slits, dy), n)
+        intensity = np.abs(field) ** 2
+
+        # |F(f)| is even for a real aperture: mirror the half spectrum
+        offsets = wavelength * L * np.fft.rfftfreq(n, dy)
+        inside = offsets <= half_width
+        offsets, intensity = offsets[inside], intensity[inside]
+        self.y = np.concatenate([-offsets[:0:-1], offsets]) + center
+        self.intensity = np.concatenate([intensity[:0:-1], intensity])
+        self.intensity /= self.intensity.max()
+
+        # Cumulative distribution (trapezoidal rule), then its inverse at
+        # equally spaced probabilities
+        cdf = np.empty(self.y.size)
+        cdf[0] = 0
+        np.cumsum(0.5 * (self.intensity[1:] + self.intensity[:-1]) * np.diff(self.y), out=cdf[1:])
+        cdf /= cdf[-1]
+        self.quantiles = np.interp(np.linspace(0, 1, table_size + 1), cdf, self.y)
+
+    def sample(self, n, random=np.random):
+        """Draw n screen positions from the intensity (random: np.random or a Generator)"""
+        u = random.random(n) * (self.quantiles.size - 1)
+        index = np.minimum(u.astype(np.int64), self.quantiles.size - 2)
+        low = self.quantiles[index]
+        return low + (u - index) * (self.quantiles[index + 1] - low)
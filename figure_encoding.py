@@ -0,0 +1,127 @@
+import base64
+
+import numpy as np
+
+from html_export import encode_float32
+
+# Opt-in compact serialization for large animations: every float array in
+# the figure's traces (initial data and all frames) is downcast to float32
+# and sent as a plotly.js typed array ({'dtype', 'bdata', 'shape'}) instead
+# of float64 JSON text or float64 base64.
+
+
+def encode_array(values):
+    """Encode a float array as a plotly.js float32 typed-array spec"""
+    values = np.asarray(values)
+    spec = {'dtype': 'f4', 'bdata': encode_float32(values)}
+    if values.ndim > 1:
+        spec['shape'] = ', '.join(str(n) for n in values.shape)
+    return spec
+
+
+def _as_float_array(value):
+    """Return value as a float ndarray if it holds numeric data, else None"""
+    if isinstance(value, dict):
+        if 'bdata' not in value or not value.get('dtype', '').startswith('f'):
+            return None
+        # plotly >= 6 already emits typed arrays, but as float64
+        array = np.frombuffer(base64.b64decode(value['bdata']), dtype=value['dtype'])
+        if 'shape' in value:
+            array = array.reshape([int(n) for n in str(value['shape']).split(',')])
+        return array
+    if isinstance(value, (list, tuple, np.ndarray)):
+        try:
+            array = np.asarray(value)
+        except ValueError:
+            # Ragged nested lists
+            return None
+        return array if array.dtype.kind == 'f' else None
+    return None
+
+
+def _encode_trace(trace, sizes):
+    """Copy of a trace dict with its float arrays (recursively) replaced by float32 specs
+
+    sizes is a [float64 bytes, float32 bytes] pair, increased by the
+    base64 payload of every array before and after encoding.
+    """
+    encoded = {}
+    for key, value in trace.items():
+        array = _as_float_array(value)
+        if array is not None and array.size > 1:
+            encoded[key] = encode_array(array)
+            sizes[0] += 4 * -(-8 * array.size // 3)
+            sizes[1] += len(encoded[key]['bdata'])
+        elif isinstance(value, dict):
+            encoded[key] = _encode_trace(value, sizes)
+        else:
+            encoded[key] = value
+    return encoded
+
+
+def _encode_frame(frame, sizes):
+    """Copy of a frame dict with its traces encoded"""
+    if 'data' not in frame:
+        return frame
+    return {**frame, 'data': [_encode_trace(trace, sizes) for trace in frame['data']]}
+
+
+def _report(sizes):
+    """Print the array payload change of a finished encoding pass"""
+    before, after = sizes
+    print(f"Figure arrays: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"({after / (before or 1):.0%})")
+
+
+def encode_figure_float32(fig, sizes=None):
+    """Return the figure as a dict whose trace arrays are float32 typed arrays"""
+    sizes = [0, 0] if sizes is None else sizes
+    fig_dict = fig if isinstance(fig, dict) else fig.to_dict()
+    fig_dict = {**fig_dict, 'data': [_encode_trace(trace, sizes) for trace in fig_dict.get('data', [])]}
+    if 'frames' in fig_dict:
+        fig_dict['frames'] = [_encode_frame(frame, sizes) for frame in fig_dict['frames']]
+    return fig_dict
+
+
+def compact_spec(spec, report=True):
+    """FigureSpec whose frames are encoded as they are built, in the writer's single pass
+
+    The size change is printed once every frame has been iterated over.
+    """
+    from figure_writer import FigureSpec, LazyFrames
+
+    sizes = [0, 0]
+    frames = spec.frames
+    data = [_encode_trace(trace, sizes) for trace in spec.data]
+
+    def build(i):
+        return _encode_frame(frames[i], sizes)
+
+    def iterate():
+        for frame in frames:
+            yield _encode_frame(frame, sizes)
+        if report:
+            _report(sizes)
+
+    return FigureSpec(data, spec.layout, LazyFrames(build, len(frames), iterate))
+
+
+def compact_figure(fig, report=True):
+    """Encode fig with float32 typed arrays, printing the array payload size change
+
+    Each frame is built and encoded once: a FigureSpec comes back as a
+    FigureSpec that encodes its frames while they are written (see
+    compact_spec); other figures are converted to a dict in one pass.
+    Sizes are the base64 payload of the float arrays, float64 before
+    (as plotly sends them) and float32 after, counted while encoding
+    rather than by serializing the figure twice.
+    """
+    from figure_writer import FigureSpec
+
+    if isinstance(fig, FigureSpec):
+        return compact_spec(fig, report)
+    sizes = [0, 0]
+    fig_dict = encode_figure_float32(fig, sizes)
+    if report:
+        _report(sizes)
+    return fig_dict
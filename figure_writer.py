@@ -0,0 +1,179 @@
+import uuid
+import weakref
+from functools import lru_cache
+
+import numpy as np
+
+# Figures as plain dicts, for animations too large for graph_objects: the
+# traces, layout and frames are dicts of numpy arrays, built without
+# plotly's property validation or deep copies, and serialized to the same
+# JSON as a go.Figure of the same specs. Frames can be produced lazily and
+# are written one at a time, so the whole figure is never in memory.
+#
+# Specs must already be in plotly's canonical form, e.g.
+# title={'text': ...} rather than a bare string, since nothing coerces them.
+
+
+class ArrayEncoder:
+    """Replace the numpy arrays in plain-dict specs with plotly.js typed arrays
+
+    Each array object is converted (and base64 encoded) once while it is
+    alive, so an array shared by reference across frames, such as a
+    constant surfacecolor, costs one conversion for the whole figure.
+    """
+
+    def __init__(self):
+        self._specs = {}
+
+    def _forget(self, key):
+        self._specs.pop(key, None)
+
+    def _encode_array(self, array):
+        """Typed-array spec of an array, reused while the same object is alive"""
+        from _plotly_utils.utils import to_typed_array_spec
+
+        key = id(array)
+        entry = self._specs.get(key)
+        if entry is not None and entry[0]() is array:
+            return entry[1]
+        spec = to_typed_array_spec(array)
+        self._specs[key] = (weakref.ref(array, lambda _, key=key: self._forget(key)), spec)
+        return spec
+
+    def __call__(self, value):
+        """Return value with every array (recursively) replaced by its spec, as go.Figure.to_dict does"""
+        from _plotly_utils.utils import is_skipped_key
+
+        if isinstance(value, np.ndarray):
+            return self._encode_array(value)
+        if isinstance(value, dict):
+            return {key: item if is_skipped_key(key) else self(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self(item) for item in value]
+        return value
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    """JSON of a registered plotly template"""
+    import plotly.io as pio
+
+    return pio.templates[name].to_plotly_json()
+
+
+def with_template(layout):
+    """layout with the default template added, as go.Figure adds it"""
+    import plotly.io as pio
+
+    if 'template' in layout or pio.templates.default is None:
+        return layout
+    return {'template': _template(pio.templates.default), **layout}
+
+
+class LazyFrames:
+    """Sequence of frame dicts computed on access: frames[i] is build(i)
+
+    Nothing is kept, so frames are built only while they are written or
+    requested, in any order. iterate, if given, is a zero-argument
+    callable yielding every frame in order, for builders that are faster
+    in batches.
+    """
+
+    def __init__(self, build, count, iterate=None):
+        self.build = build
+        self.count = count
+        self.iterate = iterate
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not -self.count <= i < self.count:
+            raise IndexError(f"frame {i} out of range for {self.count} frames")
+        return self.build(i % self.count)
+
+    def __iter__(self):
+        if self.iterate is not None:
+            return iter(self.iterate())
+        return (self.build(i) for i in range(self.count))
+
+
+class FigureSpec:
+    """A figure as plain dicts: traces, layout and animation frames
+
+    frames is a list of frame dicts or a LazyFrames, whose frames are built
+    only while they are being written. Plotly functions accept a
+    FigureSpec like a figure (through to_plotly_json), but only write_json
+    and write_html stream the frames.
+    """
+
+    def __init__(self, data, layout, frames=()):
+        self.data = data
+        self.layout = layout
+        self.frames = frames
+
+    def iter_frames(self):
+        """Iterate over the frame dicts"""
+        return iter(self.frames)
+
+    def to_dict(self):
+        """The figure dict go.Figure(data, layout, frames).to_dict() would return"""
+        encode = ArrayEncoder()
+        fig = {'data': encode(self.data), 'layout': encode(with_template(self.layout))}
+        frames = [encode(frame) for frame in self.iter_frames()]
+        if frames:
+            fig['frames'] = frames
+        return fig
+
+    def to_plotly_json(self):
+        return self.to_dict()
+
+    def to_figure(self):
+        """Validated go.Figure of the same specs"""
+        import plotly.graph_objects as go
+
+        return go.Figure(data=self.data, layout=self.layout, frames=list(self.iter_frames()) or None)
+
+    def write_json(self, path):
+        """Write the figure JSON (as pio.write_json), serializing one frame at a time"""
+        from plotly.io.json import to_json_plotly
+
+        encode = ArrayEncoder()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{"data":' + to_json_plotly(encode(self.data)))
+            f.write(',"layout":' + to_json_plotly(encode(with_template(self.layout))))
+            separator = ',"frames":['
+            for frame in self.iter_frames():
+                f.write(separator + to_json_plotly(encode(frame)))
+                separator = ','
+            f.write('}' if separator != ',' else ']}')
+
+    def write_html(self, path, **html_options):
+        """Write a standalone HTML page (as pio.write_html), serializing one frame at a time
+
+        html_options are passed to plotly.io.to_html.
+        """
+        import plotly.io as pio
+        from plotly.io.json import to_json_plotly
+
+        encode = ArrayEncoder()
+        frames = self.iter_frames()
+        first = next(frames, None)
+        fig = {'data': encode(self.data), 'layout': encode(with_template(self.layout))}
+        # The page is rendered around a placeholder frame list, which is
+        # then replaced by the frames as they are serialized
+        placeholder = [{'name': f'frames-{uuid.uuid4()}'}]
+        if first is not None:
+            fig['frames'] = placeholder
+        html_options.setdefault('validate', False)
+        html = pio.to_html(fig, **html_options)
+
+        with open(path, 'w', encoding='utf-8') as f:
+            if first is None:
+                f.write(html)
+                return
+            head, tail = html.split(to_json_plotly(placeholder), 1)
+            f.write(head + '[' + to_json_plotly(encode(first)))
+            for frame in frames:
+                f.write(',' + to_json_plotly(encode(frame)))
+            f.write(']' + tail)
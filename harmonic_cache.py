@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# On-disk cache of spherical-harmonic grids. Each (l, m) term is evaluated
+# once per grid, saved as .npy and memory-mapped on later runs, so sweeps
+# over degrees and resolutions only pay for sph_harm_y the first time.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'superposition', 'harmonics')
+
+# Symmetric combinations as (n, m, weight) terms, using the same argument
+# order as the sph_harm_y calls they are fed to; patterns are the real part
+# of the sum
+SYMMETRY_PRESETS = {
+    # Pattern of the original animation: Re Y_3^3, 3-fold about Z (trigonal,
+    # not tetrahedral). Its Y_3m3 term, sph_harm_y(-3, 3), is zero everywhere
+    'legacy': [(3, 3, 1.0)],
+    # Re(Y_3^2 + Y_3^-2) ~ (x^2 - y^2) z: the xyz harmonic turned 45 degrees about Z
+    'tetrahedral': [(3, 2, 1.0), (3, -2, 1.0)],
+    # Cubic harmonic: Y_4^0 + sqrt(5/14) (Y_4^4 + Y_4^-4)
+    'octahedral': [(4, 0, 1.0), (4, 4, np.sqrt(5 / 14)), (4, -4, np.sqrt(5 / 14))],
+    # Five-fold axis along Z: Y_6^0 + sqrt(7/11) (Y_6^5 - Y_6^-5)
+    'icosahedral': [(6, 0, 1.0), (6, 5, np.sqrt(7 / 11)), (6, -5, -np.sqrt(7 / 11))],
+}
+
+
+class HarmonicCache:
+    """Size-bounded LRU cache of Y_lm grids stored as memory-mapped .npy files
+
+    Entries are keyed by (l, m) and a hash of the grid's polar and
+    azimuth values, so any two grids that differ anywhere get their own
+    entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=512 * 1024 ** 2):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, l, m, polar, azimuth, kind):
+        """File holding the cached term for this grid"""
+        grid = hashlib.sha1()
+        for values in (polar, azimuth):
+            values = np.ascontiguousarray(values, dtype=float)
+            grid.update(repr(values.shape).encode())
+            grid.update(values.tobytes())
+        digest = grid.hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'Y_{l}_{m}_{kind}_{digest}.npy')
+
+    def sph_harm_y(self, l, m, polar, azimuth, kind='complex'):
+        """Cached scipy.special.sph_harm_y(l, m, polar, azimuth)
+
+        kind='real' caches the real part on its own, so real-only
+        consumers map half the bytes.
+        """
+        path = self._path(l, m, polar, azimuth, kind)
+        try:
+            values = np.load(path, mmap_mode='r')
+            # Touch the entry so eviction sees it as recently used
+            os.utime(path)
+            return values
+        except (FileNotFoundError, ValueError):
+            pass
+
+        if kind == 'real':
+            values = np.real(self.sph_harm_y(l, m, polar, azimuth))
+        elif kind == 'complex':
+            from scipy.special import sph_harm_y
+            values = sph_harm_y(l, m, polar, azimuth)
+        else:
+            raise ValueError(f"kind must be 'complex' or 'real', got {kind!r}")
+
+        self._store(path, values)
+        return np.load(path, mmap_mode='r')
+
+    def combination(self, terms, polar, azimuth, kind='complex'):
+        """Weighted sum of cached terms given as (l, m, weight) or a preset name"""
+        if isinstance(terms, str):
+            terms = SYMMETRY_PRESETS[terms]
+        total = 0
+        for l, m, weight in terms:
+            total = total + weight * self.sph_harm_y(l, m, polar, azimuth, kind)
+        return total
+
+    def _store(self, path, values):
+        """Write an entry atomically, then evict down to max_bytes"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, values)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def entries(self):
+        """Cached files as (mtime, size, path), least recently used first"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Still mapped on platforms that forbid it, or already gone
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove every cached entry"""
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class SharedHarmonics(HarmonicCache):
+    """HarmonicCache that keeps every term it hands out for its own lifetime
+
+    Animations built with the same (l, m, grid), such as the jobs of a
+    sweep or the rebuilds of the preview server, get the same array
+    instead of loading the .npy file again.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.terms = {}
+        self.loaded = 0
+        self.reused = 0
+
+    def sph_harm_y(self, l, m, polar, azimuth, kind='complex'):
+        path = self._path(l, m, polar, azimuth, kind)
+        if path in self.terms:
+            self.reused += 1
+        else:
+            self.terms[path] = super().sph_harm_y(l, m, polar, azimuth, kind)
+            self.loaded += 1
+        return self.terms[path]
@@ -0,0 +1,115 @@
+import base64
+import json
+
+import numpy as np
+
+# Compact HTML export for periodic harmonic animations. Instead of
+# embedding one go.Frame per time step, the page carries the grid, the
+# constant radial pattern of each wave and the animation parameters once,
+# and a small script recomputes every sphere surface in the browser,
+# applying them with Plotly.restyle.
+
+_ANIMATION_SCRIPT = '''
+(function() {
+    var gd = document.getElementById('{plot_id}');
+    var p = %(params)s;
+
+    // Decode the float32 radial patterns (row-major, phi rows x theta columns)
+    var patterns = p.waves.map(function(wave) {
+        var bytes = Uint8Array.from(atob(wave.pattern), function(c) { return c.charCodeAt(0); });
+        return new Float32Array(bytes.buffer);
+    });
+    var traces = p.waves.map(function(wave, k) { return k; });
+    var nPhi = p.phi.length, nTheta = p.theta.length;
+    var sinPhi = p.phi.map(Math.sin), cosPhi = p.phi.map(Math.cos);
+
+    // Sphere scaled by r_base + amplitude * Y * cos(frequency * t + phase), rotated about Z by spin * t
+    function sphere(wave, pattern, t) {
+        var x = [], y = [], z = [];
+        var oscillation = wave.amplitude * Math.cos(wave.frequency * t + wave.phase);
+        var angle = wave.spin * t;
+        var cosTheta = p.theta.map(function(theta) { return Math.cos(theta + angle); });
+        var sinTheta = p.theta.map(function(theta) { return Math.sin(theta + angle); });
+        for (var i = 0; i < nPhi; i++) {
+            var xRow = new Array(nTheta), yRow = new Array(nTheta), zRow = new Array(nTheta);
+            for (var j = 0; j < nTheta; j++) {
+                var r = p.r_base + oscillation * pattern[i * nTheta + j];
+                xRow[j] = r * sinPhi[i] * cosTheta[j];
+                yRow[j] = r * sinPhi[i] * sinTheta[j];
+                zRow[j] = r * cosPhi[i];
+            }
+            x.push(xRow); y.push(yRow); z.push(zRow);
+        }
+        return {x: x, y: y, z: z};
+    }
+
+    var frame = 0, timer = null;
+    function step() {
+        frame = (frame + 1) %% p.num_frames;
+        var t = frame * 2 * Math.PI / p.num_frames;
+        var spheres = p.waves.map(function(wave, k) { return sphere(wave, patterns[k], t); });
+        Plotly.restyle(gd, {
+            x: spheres.map(function(s) { return s.x; }),
+            y: spheres.map(function(s) { return s.y; }),
+            z: spheres.map(function(s) { return s.z; })
+        }, traces);
+    }
+
+    gd.on('plotly_buttonclicked', function(event) {
+        if (event.button.label === 'Play' && timer === null) {
+            timer = setInterval(step, p.frame_duration);
+        } else if (event.button.label === 'Pause' && timer !== null) {
+            clearInterval(timer);
+            timer = null;
+        }
+    });
+})();
+'''
+
+
+def encode_float32(values):
+    """Base64 of an array downcast to little-endian float32"""
+    return base64.b64encode(np.ascontiguousarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def write_harmonic_animation_html(fig, path, theta, phi, waves, r_base, num_frames, frame_duration=240,
+                                  include_plotlyjs=True):
+    """Write fig as HTML animated client-side instead of through go.Frames
+
+    fig supplies the initial traces (one sphere per wave at t = 0) and the
+    layout; any frames it holds are dropped. theta and phi are the 1-D
+    grid axes. Each wave is a dict with the (phi, theta) radial
+    perturbation pattern and its amplitude, phase, frequency and spin.
+    plotly.js is embedded, so the page works offline, like the other
+    previews; include_plotlyjs='cdn' (see plotly.io.write_html) loads it
+    from the network instead, for a much smaller file.
+    """
+    import plotly.graph_objects as go
+
+    page = go.Figure(data=fig.data, layout=fig.layout)
+    # Play/Pause only fire plotly_buttonclicked; the script drives the frames
+    page.update_layout(updatemenus=[
+        dict(menu.to_plotly_json(),
+             buttons=[dict(label=button.label, method='skip') for button in menu.buttons])
+        for menu in fig.layout.updatemenus
+    ])
+
+    params = {
+        'theta': np.asarray(theta, dtype=float).tolist(),
+        'phi': np.asarray(phi, dtype=float).tolist(),
+        'waves': [
+            {
+                'pattern': encode_float32(wave['pattern']),
+                'amplitude': wave['amplitude'],
+                'phase': wave['phase'],
+                'frequency': wave['frequency'],
+                'spin': wave['spin'],
+            }
+            for wave in waves
+        ],
+        'r_base': r_base,
+        'num_frames': num_frames,
+        'frame_duration': frame_duration,
+    }
+    page.write_html(path, include_plotlyjs=include_plotlyjs,
+                    post_script=_ANIMATION_SCRIPT % {'params': json.dumps(params)})
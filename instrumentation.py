@@ -0,0 +1,141 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Lightweight instrumentation for render runs: named (nestable) spans
+# around pipeline stages, per-frame timings, and optional cProfile and
+# tracemalloc capture. Everything ends up in one JSON report.
+
+
+class Instrumentation:
+    """Collect stage spans and per-frame timings for one run
+
+    With enabled=False every method is a cheap no-op, so scripts can
+    leave the spans in place.
+    """
+
+    def __init__(self, enabled=True, profile=False, trace_memory=False):
+        self.enabled = enabled
+        self.spans = []
+        self.frames = {}
+        self._stack = []
+        self._t0 = time.perf_counter()
+        self.started_at = time.time()
+        self.profiler = cProfile.Profile() if enabled and profile else None
+        self.trace_memory = enabled and trace_memory
+        if self.profiler is not None:
+            self.profiler.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def span(self, name):
+        """Time a named stage; spans opened inside it are recorded as children"""
+        if not self.enabled:
+            yield
+            return
+
+        record = {'name': name, 'parent': self._stack[-1]['name'] if self._stack else None,
+                  'start_s': time.perf_counter() - self._t0}
+        if self.trace_memory:
+            # Keep the parent's peak before resetting it for this span
+            if self._stack:
+                self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            record['_peak'] = 0
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['duration_s'] = time.perf_counter() - start
+            self._stack.pop()
+            if self.trace_memory:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = peak / 1e6
+                if self._stack:
+                    self._stack[-1]['_peak'] = max(self._stack[-1]['_peak'], peak)
+            self.spans.append(record)
+
+    def record_frame(self, stage, index, seconds):
+        """Store the time one frame spent in a stage"""
+        if self.enabled:
+            self.frames.setdefault(stage, {})[index] = seconds
+
+    @contextmanager
+    def frame_span(self, stage, index):
+        """Time the work done for frame `index` in a stage"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_frame(stage, index, time.perf_counter() - start)
+
+    def report(self, hot_frames=5, profile_entries=30):
+        """Machine-readable summary of the run"""
+        summary = {}
+        for span in self.spans:
+            entry = summary.setdefault(span['name'], {'count': 0, 'total_s': 0.0})
+            entry['count'] += 1
+            entry['total_s'] += span['duration_s']
+
+        frames = {}
+        for stage, timings in self.frames.items():
+            seconds = sorted(timings.values())
+            frames[stage] = {
+                'count': len(seconds),
+                'total_s': sum(seconds),
+                'mean_s': sum(seconds) / len(seconds),
+                'median_s': seconds[len(seconds) // 2],
+                'max_s': seconds[-1],
+                'hot_frames': sorted(timings, key=timings.get, reverse=True)[:hot_frames],
+                'per_frame_s': [timings[i] for i in sorted(timings)],
+            }
+
+        report = {
+            'started_at': self.started_at,
+            'wall_s': time.perf_counter() - self._t0,
+            'pid': os.getpid(),
+            'summary': summary,
+            'spans': sorted(self.spans, key=lambda span: span['start_s']),
+            'frames': frames,
+        }
+        if self.trace_memory:
+            report['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        if self.profiler is not None:
+            report['profile'] = self._profile_entries(profile_entries)
+        return report
+
+    def _profile_entries(self, limit):
+        """Top functions by cumulative time from the cProfile capture"""
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler)
+        rows = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            rows.append({'function': f'{filename}:{line}({function})', 'calls': calls,
+                         'own_s': own, 'cumulative_s': cumulative})
+        rows.sort(key=lambda row: row['cumulative_s'], reverse=True)
+        self.profiler.enable()
+        return rows[:limit]
+
+    def write_report(self, path):
+        """Write the report as JSON (and the raw cProfile stats next to it)"""
+        if not self.enabled:
+            return
+        report = self.report()
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.splitext(path)[0] + '.prof')
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+        print(f"Timing report written to {path}")
+
+
+# Shared no-op recorder for code that is not being measured
+NULL_INSTRUMENT = Instrumentation(enabled=False)
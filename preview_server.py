@@ -0,0 +1,520 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local preview server. Instead of sending every precomputed frame with
+# the page, as fig.show() does, the page starts with the first frame and
+# fetches the others as the slider or Play button reaches them. Frames
+# are computed on demand, kept serialized in an LRU cache, and the frames
+# after the one being viewed are computed ahead in a background thread.
+# Scene parameters (amplitude, spin_speed, ...) are edited on the page:
+# the scene is rebuilt without restarting the server, and the frames of
+# earlier parameter values stay cached.
+#
+#   python preview_server.py
+#   python cli.py serve superposition --grid auto
+#   python cli.py serve double-slit --particles 100000 --display density
+
+# Server settings
+host = '127.0.0.1'  # only reachable from this machine
+port = 8050  # 0 picks a free port
+cache_mb = 512  # serialized frames kept across all parameter values
+prefetch_frames = 8  # frames computed ahead of the one being viewed
+
+
+# Scenes: a build function returning a FigureSpec from keyword parameters,
+# and the starting values of those parameters. Frames are cached by
+# parameter values, so a build must always give the same figure for the
+# same values
+def sphere_scene(animation):
+    """Build function and live parameters of the superposition figure, starting from animation
+
+    The two default waves take amplitude and spin_speed; declared waves
+    take amplitude_k and spin_k for each wave k.
+    """
+    from harmonic_cache import SharedHarmonics
+    from superposition import SphereAnimation, default_waves
+
+    # Rebuilds with the same grid reuse the harmonic terms
+    harmonics = SharedHarmonics()
+    default = animation.waves == default_waves(animation.l, animation.m_values, animation.amplitude,
+                                               animation.spin_speed)
+    if default:
+        params = {'amplitude': float(animation.amplitude), 'spin_speed': float(animation.spin_speed)}
+    else:
+        params = {}
+        for k, wave in enumerate(animation.waves, 1):
+            params.update({f'amplitude_{k}': wave['amplitude'], f'spin_{k}': wave['spin']})
+    params['num_frames'] = animation.num_frames
+    initial = dict(params)
+
+    def build(num_frames, **wave_params):
+        if dict(wave_params, num_frames=num_frames) == initial:
+            return animation.figure_spec()
+        if default:
+            waves = None
+        else:
+            waves = [dict(wave, amplitude=wave_params[f'amplitude_{k}'], spin=wave_params[f'spin_{k}'])
+                     for k, wave in enumerate(animation.waves, 1)]
+        return SphereAnimation(grid_resolution=animation.grid_resolution, r_base=animation.r_base,
+                               amplitude=wave_params.get('amplitude', animation.amplitude),
+                               spin_speed=wave_params.get('spin_speed', animation.spin_speed),
+                               num_frames=num_frames, l=animation.l, m_values=animation.m_values, waves=waves,
+                               frame_chunk_mb=animation.frame_chunk_mb, target_pixels=animation.target_pixels,
+                               max_error_px=animation.max_error_px, harmonics=harmonics).figure_spec()
+
+    return build, params
+
+
+def double_slit_scene(n_particles, n_frames, seed=None, mode='markers'):
+    """Build function and live parameters of the double-slit figure"""
+    import numpy as np
+
+    import double_slit_experiment as ds
+
+    # A fixed seed, so rebuilding with earlier values gives the cached particles
+    seed = np.random.SeedSequence().entropy if seed is None else seed
+
+    def build(n_particles, n_frames):
+        return ds.figure_spec(n_particles=n_particles, n_frames=n_frames, seed=seed, mode=mode)
+
+    return build, {'n_particles': n_particles, 'n_frames': n_frames}
+
+
+def parse_params(changes, current):
+    """current updated with changes, which must be numbers (whole for the integer parameters)"""
+    if not isinstance(changes, dict):
+        raise ValueError("expected a JSON object of parameter values")
+    params = dict(current)
+    for name, value in changes.items():
+        if name not in current:
+            raise ValueError(f"unknown parameter {name!r}, expected one of {', '.join(current)}")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be a number, got {value!r}") from None
+        if value != value or abs(value) == float('inf'):
+            raise ValueError(f"{name} must be finite")
+        if isinstance(current[name], int):
+            # Counts: frames, particles
+            if not value.is_integer() or value < 1:
+                raise ValueError(f"{name} must be a positive integer")
+            value = int(value)
+        params[name] = value
+    return params
+
+
+def _play_duration(layout, default=100):
+    """Milliseconds per frame of the layout's Play button"""
+    try:
+        return layout['updatemenus'][0]['buttons'][0]['args'][1]['frame']['duration']
+    except (KeyError, IndexError, TypeError):
+        return default
+
+
+class FrameLRU:
+    """Serialized frames by key, dropping the least recently used beyond max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Cached frame or None, counted as a hit or miss"""
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def peek(self, key):
+        """Cached frame or None, without counting or refreshing it"""
+        with self.lock:
+            return self.frames.get(key)
+
+    def put(self, key, frame):
+        with self.lock:
+            if key in self.frames:
+                self.size -= len(self.frames[key])
+            self.frames[key] = frame
+            self.frames.move_to_end(key)
+            self.size += len(frame)
+            # The newest frame is kept even if it alone exceeds the limit
+            while self.size > self.max_bytes and len(self.frames) > 1:
+                _, dropped = self.frames.popitem(last=False)
+                self.size -= len(dropped)
+
+    def stats(self):
+        with self.lock:
+            return {'frames': len(self.frames), 'mb': round(self.size / 1e6, 3),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class PreviewSession:
+    """The scene being previewed, its frame cache and the prefetch thread"""
+
+    def __init__(self, build, params, cache_mb=cache_mb, prefetch=prefetch_frames):
+        self.build = build
+        self.cache = FrameLRU(int(cache_mb * 1e6))
+        self.prefetch = prefetch
+        self.scene = None
+        self.version = 0
+        self.computed = 0
+        self.compute_seconds = 0.0
+        # Frames are computed one at a time, by a request or by the prefetcher
+        self.compute_lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        # The last frame requested, which the prefetcher continues from
+        self.wakeup = threading.Condition()
+        self.cursor = None
+        self.set_params({}, params)
+        threading.Thread(target=self._prefetch_loop, name='prefetch', daemon=True).start()
+
+    def set_params(self, changes, current=None):
+        """Rebuild the scene with changed parameter values and return the new page state (JSON bytes)"""
+        from figure_writer import ArrayEncoder, with_template
+        from plotly.io.json import to_json_plotly
+
+        with self.rebuild_lock:
+            params = parse_params(changes, self.scene['params'] if current is None else current)
+            start = time.perf_counter()
+            spec = self.build(**params)
+            # The page draws its own controls, and keeps the camera across rebuilds
+            layout = {key: value for key, value in spec.layout.items() if key not in ('updatemenus', 'sliders')}
+            layout.setdefault('uirevision', 'preview')
+            encode = ArrayEncoder()
+            self.version += 1
+            state = {
+                'version': self.version,
+                'params': params,
+                'num_frames': len(spec.frames),
+                'frame_duration': _play_duration(spec.layout),
+                'data': encode(spec.data),
+                'layout': encode(with_template(layout)),
+            }
+            self.scene = {
+                'version': self.version,
+                'params': params,
+                'key': json.dumps(params, sort_keys=True),
+                'spec': spec,
+                'encode': encode,
+                'num_frames': state['num_frames'],
+                'state': to_json_plotly(state).encode(),
+            }
+            print(f"Scene built: {', '.join(f'{k}={v}' for k, v in params.items())} "
+                  f"({time.perf_counter() - start:.2f}s)")
+            return self.scene['state']
+
+    def state(self):
+        """Page state of the current scene (JSON bytes)"""
+        return self.scene['state']
+
+    def frame(self, i, version=None):
+        """Frame i of the current scene as JSON bytes, or None if version is not the current one
+
+        The frames after i are then prefetched.
+        """
+        scene = self.scene
+        if version is not None and version != scene['version']:
+            return None
+        if not 0 <= i < scene['num_frames']:
+            raise IndexError(f"frame {i} out of range for {scene['num_frames']} frames")
+        frame = self.cache.get((scene['key'], i))
+        if frame is None:
+            frame = self._compute(scene, i)
+        with self.wakeup:
+            self.cursor = (scene, i)
+            self.wakeup.notify()
+        return frame
+
+    def _compute(self, scene, i):
+        """Serialize frame i of scene into the cache, unless it is already there"""
+        from plotly.io.json import to_json_plotly
+
+        key = (scene['key'], i)
+        with self.compute_lock:
+            frame = self.cache.peek(key)
+            if frame is None:
+                start = time.perf_counter()
+                frame = to_json_plotly(scene['encode'](scene['spec'].frames[i])).encode()
+                self.cache.put(key, frame)
+                self.computed += 1
+                self.compute_seconds += time.perf_counter() - start
+        return frame
+
+    def _prefetch_loop(self):
+        """Compute the frames after the last one requested, until another is requested"""
+        while True:
+            with self.wakeup:
+                while self.cursor is None:
+                    self.wakeup.wait()
+                scene, start = self.cursor
+                self.cursor = None
+            count = scene['num_frames']
+            for step in range(1, min(self.prefetch, count - 1) + 1):
+                if self.cursor is not None or scene is not self.scene:
+                    break
+                try:
+                    self._compute(scene, (start + step) % count)
+                except Exception as e:
+                    print(f"Prefetch of frame {(start + step) % count} failed: {e}")
+                    break
+
+    def stats(self):
+        """Cache and frame computation counters"""
+        return dict(self.cache.stats(), version=self.version, computed=self.computed,
+                    mean_compute_ms=round(1e3 * self.compute_seconds / max(self.computed, 1), 2))
+
+
+@lru_cache(maxsize=None)
+def plotly_js():
+    """The plotly.js bundled with plotly, so the page works offline"""
+    from plotly.offline import get_plotlyjs
+
+    return get_plotlyjs().encode()
+
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Animation preview</title>
+<script src="plotly.min.js"></script>
+<style>
+  body { font-family: sans-serif; margin: 12px; }
+  #controls { display: flex; flex-wrap: wrap; gap: 12px; align-items: center; }
+  #controls input[type=number] { width: 6em; }
+  #slider { width: 300px; }
+  #status { color: #b00; }
+</style>
+</head>
+<body>
+<div id="controls">
+  <button id="play">Play</button>
+  <input id="slider" type="range" min="0" max="0" value="0" step="1">
+  <span id="label"></span>
+  <span id="params"></span>
+  <span id="status"></span>
+</div>
+<div id="plot"></div>
+<script>
+(function () {
+  var plot = document.getElementById('plot');
+  var playButton = document.getElementById('play');
+  var slider = document.getElementById('slider');
+  var label = document.getElementById('label');
+  var paramsBox = document.getElementById('params');
+  var status = document.getElementById('status');
+  var state = null, current = 0, wanted = null, loading = false, playing = false, timer = null;
+
+  function request(url, options) {
+    return fetch(url, options).then(function (response) {
+      if (!response.ok) {
+        return response.text().then(function (text) { throw new Error(text); });
+      }
+      return response.json();
+    });
+  }
+
+  function setState(next) {
+    state = next;
+    slider.max = state.num_frames - 1;
+    current = Math.min(current, state.num_frames - 1);
+    return Plotly.react(plot, state.data, state.layout);
+  }
+
+  // One frame request at a time; while one loads, only the newest wanted frame is kept
+  function show(i) {
+    wanted = i;
+    if (!loading) load();
+  }
+
+  function load() {
+    var i = wanted, version = state.version;
+    wanted = null;
+    loading = true;
+    request('frame?i=' + i + '&v=' + version).then(function (frame) {
+      if (version !== state.version) return;
+      return Plotly.animate(plot, frame, {
+        frame: {duration: 0, redraw: true}, transition: {duration: 0}, mode: 'immediate'
+      }).then(function () {
+        current = i;
+        slider.value = i;
+        label.textContent = 'frame ' + (i + 1) + ' / ' + state.num_frames;
+        status.textContent = '';
+      });
+    }).catch(function (error) {
+      if (version === state.version) status.textContent = error.message;
+    }).then(function () {
+      loading = false;
+      if (wanted !== null) load();
+      else if (playing) timer = setTimeout(step, state.frame_duration);
+    });
+  }
+
+  function step() {
+    show((current + 1) % state.num_frames);
+  }
+
+  function setPlaying(on) {
+    playing = on;
+    playButton.textContent = on ? 'Pause' : 'Play';
+    clearTimeout(timer);
+    if (on && !loading) step();
+  }
+
+  function buildParams() {
+    paramsBox.textContent = '';
+    Object.keys(state.params).forEach(function (name) {
+      var field = document.createElement('label');
+      var input = document.createElement('input');
+      input.type = 'number';
+      input.step = 'any';
+      input.value = state.params[name];
+      input.addEventListener('change', function () {
+        var changes = {};
+        changes[name] = Number(input.value);
+        status.textContent = 'rebuilding...';
+        request('params', {method: 'POST', body: JSON.stringify(changes)}).then(function (next) {
+          status.textContent = '';
+          return setState(next).then(function () { show(current); });
+        }).catch(function (error) {
+          input.value = state.params[name];
+          status.textContent = error.message;
+        });
+      });
+      field.appendChild(document.createTextNode(name + ' '));
+      field.appendChild(input);
+      paramsBox.appendChild(field);
+      paramsBox.appendChild(document.createTextNode(' '));
+    });
+  }
+
+  playButton.addEventListener('click', function () { setPlaying(!playing); });
+  slider.addEventListener('input', function () { show(Number(slider.value)); });
+
+  request('state').then(function (initial) {
+    return setState(initial).then(function () {
+      buildParams();
+      show(0);
+    });
+  }).catch(function (error) { status.textContent = error.message; });
+})();
+</script>
+</body>
+</html>
+'''
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+    """GET /, /plotly.min.js, /state, /frame?i=N&v=VERSION, /stats; POST /params"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        session = self.server.session
+        if url.path == '/':
+            self._send(PAGE.encode(), 'text/html; charset=utf-8')
+        elif url.path == '/plotly.min.js':
+            self._send(plotly_js(), 'application/javascript')
+        elif url.path == '/state':
+            self._send(session.state())
+        elif url.path == '/frame':
+            query = parse_qs(url.query)
+            try:
+                i = int(query['i'][0])
+                version = int(query['v'][0]) if 'v' in query else None
+            except (KeyError, ValueError):
+                return self._error(400, "expected /frame?i=<frame>&v=<version>")
+            try:
+                frame = session.frame(i, version)
+            except IndexError as e:
+                return self._error(404, str(e))
+            if frame is None:
+                return self._error(409, "the scene was rebuilt with new parameters")
+            self._send(frame)
+        elif url.path == '/stats':
+            self._send(json.dumps(session.stats()).encode())
+        else:
+            self._error(404, f"no such page: {url.path}")
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/params':
+            return self._error(404, f"no such page: {self.path}")
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            state = self.server.session.set_params(json.loads(body or b'{}'))
+        except ValueError as e:
+            return self._error(400, str(e))
+        self._send(state)
+
+    def _send(self, body, content_type='application/json'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, code, message):
+        body = message.encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Every frame is a request: log errors only
+        pass
+
+
+def make_server(build, params, host=host, port=port, cache_mb=cache_mb, prefetch=prefetch_frames):
+    """HTTP server previewing the scene build(**params), not yet serving"""
+    server = ThreadingHTTPServer((host, port), PreviewHandler)
+    server.daemon_threads = True
+    server.session = PreviewSession(build, params, cache_mb=cache_mb, prefetch=prefetch)
+    return server
+
+
+def serve(build, params, host=host, port=port, cache_mb=cache_mb, prefetch=prefetch_frames, open_browser=True):
+    """Serve the scene build(**params) until interrupted"""
+    server = make_server(build, params, host, port, cache_mb, prefetch)
+    url = f"http://{host}:{server.server_port}/"
+    print(f"Preview server running at {url} (Ctrl+C to stop)")
+    if open_browser:
+        import webbrowser
+        webbrowser.open(url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Preview server stopped")
+    finally:
+        server.server_close()
+
+
+def main():
+    """Serve the superposition scene (or double-slit, given as the argument) with the module settings"""
+    if sys.argv[1:] == ['double-slit']:
+        import double_slit_experiment as ds
+
+        serve(*double_slit_scene(ds.n_particles, ds.n_frames, ds.random_seed, ds.display_mode))
+    else:
+        from superposition import SphereAnimation
+
+        serve(*sphere_scene(SphereAnimation()))
+
+
+if __name__ == '__main__':
+    main()
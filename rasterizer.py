@@ -0,0 +1,358 @@
+import multiprocessing
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# Offline renderer for video export. Surface meshes (the x/y/z grids,
+# surfacecolor and colorscale of a plotly Surface trace) are projected with
+# a camera matching plotly's 3D scenes, rasterized as triangles into a
+# z-buffer per (surface, front/back) layer, shaded, and alpha-blended back
+# to front straight into an RGB array. No figure is built and no browser is
+# involved; axes, ticks and titles are not drawn.
+
+
+def parse_color(color):
+    """RGBA (0-1 floats) of a plotly colour string: '#rrggbb', 'rgb(...)' or 'rgba(...)'"""
+    color = color.strip()
+    if color.startswith('#'):
+        return np.array([int(color[i:i + 2], 16) / 255 for i in (1, 3, 5)] + [1.0])
+    values = [float(v) for v in re.findall(r'[-+]?[\d.]+', color)]
+    alpha = values[3] if len(values) > 3 else 1.0
+    return np.array([values[0] / 255, values[1] / 255, values[2] / 255, alpha])
+
+
+def parse_colorscale(colorscale):
+    """Positions (n,) and RGBA colours (n, 4) of a [[position, colour], ...] colorscale"""
+    positions = np.array([float(position) for position, _ in colorscale])
+    colors = np.array([parse_color(color) for _, color in colorscale])
+    return positions, colors
+
+
+@lru_cache(maxsize=8)
+def grid_triangles(n_rows, n_cols):
+    """Corner vertex indices (3, 2 * (n_rows - 1) * (n_cols - 1)) of a triangulated grid
+
+    Built once per grid shape. The indices are np.intp: numpy gathers with
+    them about twice as fast as with int32.
+    """
+    index = np.arange(n_rows * n_cols, dtype=np.intp).reshape(n_rows, n_cols)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    return np.stack([np.concatenate([a, a]), np.concatenate([b, d]), np.concatenate([d, c])])
+
+
+def vertex_normals(x, y, z):
+    """Unit normals (x, y, z components) of a surface grid from its parametric derivatives"""
+    xu, yu, zu = (np.gradient(v, axis=0) for v in (x, y, z))
+    xv, yv, zv = (np.gradient(v, axis=1) for v in (x, y, z))
+    nx, ny, nz = yu * zv - zu * yv, zu * xv - xu * zv, xu * yv - yu * xv
+    length = np.sqrt(nx * nx + ny * ny + nz * nz)
+    # Collapsed rows (the poles of a sphere) have no tangent plane: use the radial direction
+    flat = length < 1e-12
+    if flat.any():
+        nx, ny, nz = np.where(flat, x, nx), np.where(flat, y, ny), np.where(flat, z, nz)
+        length = np.sqrt(nx * nx + ny * ny + nz * nz)
+    length = np.maximum(length, 1e-12)
+    return nx / length, ny / length, nz / length
+
+
+class SurfaceRasterizer:
+    """Render plotly-style Surface meshes to RGB arrays with a z-buffer
+
+    The camera follows plotly's 3D scene: each axis range is scaled to the
+    aspect ratio box centred on the origin, viewed from `eye` (in box
+    units) with a pi/4 vertical field of view, inside the plot area left
+    by the layout margins (top, bottom, left, right).
+    """
+
+    def __init__(self, width=900, height=900, ranges=((-1, 1),) * 3, aspect=(1, 1, 1),
+                 eye=(1.25, 1.25, 1.25), center=(0, 0, 0), up=(0, 0, 1), fovy=np.pi / 4,
+                 margins=(100, 80, 80, 80), paper=(255, 255, 255), background=(240, 240, 240),
+                 ambient=0.8, diffuse=0.8):
+        self.width = width
+        self.height = height
+        self.ambient = ambient
+        self.diffuse = diffuse
+
+        # Data -> aspect box: scale and offset per axis
+        ranges = np.asarray(ranges, dtype=float)
+        self.scale = np.asarray(aspect, dtype=float) / (ranges[:, 1] - ranges[:, 0])
+        self.offset = -self.scale * ranges.mean(axis=1)
+
+        # View basis (right, up, forward) looking from eye at center
+        eye = np.asarray(eye, dtype=float)
+        forward = np.asarray(center, dtype=float) - eye
+        forward /= np.linalg.norm(forward)
+        right = np.cross(forward, up)
+        right /= np.linalg.norm(right)
+        self.eye = eye
+        self.basis = np.stack([right, np.cross(right, forward), forward])
+
+        # Viewport of the scene in pixels
+        top, bottom, left, right_margin = margins
+        self.viewport = (left, top, width - left - right_margin, height - top - bottom)
+        self.focal = 0.5 * self.viewport[3] / np.tan(fovy / 2)
+
+        # Empty frame: paper with the scene background over the viewport
+        self.backdrop = np.empty((height, width, 3), dtype=np.uint8)
+        self.backdrop[:] = paper
+        self.backdrop[top:top + self.viewport[3], left:left + self.viewport[2]] = background
+
+        # Unlit vertex colours per surfacecolor array, which stays the same
+        # from frame to frame (see _colors)
+        self._color_cache = {}
+
+    def project(self, x, y, z):
+        """Screen coordinates (px, py) in pixels and view depth of data points"""
+        # Data -> view coordinates in one affine map per axis
+        matrix = self.basis * self.scale
+        shift = self.basis @ (self.offset - self.eye)
+        x, y, z = np.ravel(x), np.ravel(y), np.ravel(z)
+        view = [matrix[k, 0] * x + matrix[k, 1] * y + matrix[k, 2] * z + shift[k] for k in range(3)]
+        depth = view[2]
+        left, top, width, height = self.viewport
+        scale = self.focal / depth
+        px = left + 0.5 * width + view[0] * scale
+        py = top + 0.5 * height - view[1] * scale
+        return px, py, depth
+
+    def _colors(self, surface):
+        """Unlit RGBA per vertex from the colorscale, cached per surfacecolor buffer
+
+        Frames of an animation pass views of the same, unchanging pattern
+        arrays, so the cache is keyed on the memory a view points at; the
+        view is kept with its colours, so that memory cannot be reused.
+        """
+        values = np.asarray(surface['surfacecolor'])
+        key = (values.__array_interface__['data'][0], values.shape, values.strides, values.dtype.str,
+               surface.get('cmin'), surface.get('cmax'), repr(surface['colorscale']))
+        cached = self._color_cache.get(key)
+        if cached is not None:
+            return cached[1]
+        positions, colors = parse_colorscale(surface['colorscale'])
+        flat = np.ravel(values)
+        cmin = surface.get('cmin', flat.min())
+        cmax = surface.get('cmax', flat.max())
+        t = np.clip((flat - cmin) / ((cmax - cmin) or 1), 0, 1)
+        rgba = np.stack([np.interp(t, positions, colors[:, k]) for k in range(4)], axis=1)
+        if len(self._color_cache) >= 8:
+            self._color_cache.clear()
+        self._color_cache[key] = (values, rgba)
+        return rgba
+
+    def _shade(self, surface, x, y, z):
+        """Lit RGBA per vertex: colorscale colour and alpha, ambient + diffuse headlight"""
+        rgba = self._colors(surface).copy()
+
+        # Two-sided lighting from the camera; normals are taken in the aspect box
+        nx, ny, nz = vertex_normals(x * self.scale[0], y * self.scale[1], z * self.scale[2])
+        view = self.basis[2]
+        facing = np.abs(view[0] * nx + view[1] * ny + view[2] * nz).ravel()
+        rgba[:, :3] *= np.minimum(self.ambient + self.diffuse * facing, 1)[:, None]
+        return rgba
+
+    def _fragments(self, px, py, depth, triangles, window):
+        """Pixels covered by each triangle: (pixel index in window, depth, triangle, front-facing)
+
+        window = (left, top, width, height) is the part of the image rendered.
+        """
+        left, top, width, height = window
+        ia, ib, ic = triangles
+        xa, xb, xc = px[ia] - left, px[ib] - left, px[ic] - left
+        ya, yb, yc = py[ia] - top, py[ib] - top, py[ic] - top
+        area = (xb - xa) * (yc - ya) - (xc - xa) * (yb - ya)
+
+        # Pixel centres (i + 0.5) inside each triangle's bounding box; only
+        # the triangles covering one are carried on
+        x0 = np.maximum(np.ceil(np.minimum(np.minimum(xa, xb), xc) - 0.5), 0)
+        x1 = np.minimum(np.floor(np.maximum(np.maximum(xa, xb), xc) - 0.5), width - 1)
+        y0 = np.maximum(np.ceil(np.minimum(np.minimum(ya, yb), yc) - 0.5), 0)
+        y1 = np.minimum(np.floor(np.maximum(np.maximum(ya, yb), yc) - 0.5), height - 1)
+        za, zb, zc = depth[ia], depth[ib], depth[ic]
+        ids = np.flatnonzero((x1 >= x0) & (y1 >= y0) & (np.abs(area) >= 1e-9)
+                             & (np.minimum(np.minimum(za, zb), zc) > 0))
+        if not ids.size:
+            return np.empty(0, np.intp), np.empty(0, np.float32), ids, np.empty(0, bool)
+        box_w, box_h = (x1 - x0)[ids] + 1, (y1 - y0)[ids] + 1
+        x0, y0 = (x0[ids] + 0.5).astype(np.float32), (y0[ids] + 0.5).astype(np.float32)
+        xa, xb, xc, ya, yb, yc = xa[ids], xb[ids], xc[ids], ya[ids], yb[ids], yc[ids]
+        za, zb, zc, area = za[ids], zb[ids], zc[ids], area[ids]
+
+        # Edge functions oriented so the inside is positive, and the depth plane,
+        # as per-triangle coefficients of (px, py, 1); depth is interpolated
+        # linearly in screen space, plenty for ordering layers. One row per
+        # coefficient, so the rows a pass needs are gathered in a single take
+        sign = np.sign(area)
+        coefficients = np.empty((12, ids.size), dtype=np.float32)
+        for k, (xi, yi, xj, yj) in enumerate([(xb, yb, xc, yc), (xc, yc, xa, ya), (xa, ya, xb, yb)]):
+            a = (yi - yj) * sign
+            b = (xj - xi) * sign
+            coefficients[3 * k] = a
+            coefficients[3 * k + 1] = b
+            coefficients[3 * k + 2] = -(a * xi + b * yi)
+        dx1, dy1, dz1 = xb - xa, yb - ya, zb - za
+        dx2, dy2, dz2 = xc - xa, yc - ya, zc - za
+        dz_dx = (dz1 * dy2 - dz2 * dy1) / area
+        dz_dy = (dx1 * dz2 - dx2 * dz1) / area
+        coefficients[9] = dz_dx
+        coefficients[10] = dz_dy
+        coefficients[11] = za - dz_dx * xa - dz_dy * ya
+
+        # One candidate per (triangle, pixel in its box), built one box
+        # offset at a time: the boxes of a fine mesh are a few pixels wide,
+        # so this is a handful of passes with no repeat or division
+        tri, fx, fy = [], [], []
+        for dy in range(int(box_h.max())):
+            rows = np.flatnonzero(box_h > dy)
+            row_w = box_w[rows]
+            for dx in range(int(row_w.max())):
+                sel = rows[row_w > dx] if dx else rows
+                tri.append(sel)
+                fx.append(x0[sel] + dx)
+                fy.append(y0[sel] + dy)
+        tri, fx, fy = np.concatenate(tri), np.concatenate(fx), np.concatenate(fy)
+
+        edges = coefficients[:9].take(tri, axis=1)
+        inside = ((edges[0] * fx + edges[1] * fy + edges[2] >= 0)
+                  & (edges[3] * fx + edges[4] * fy + edges[5] >= 0)
+                  & (edges[6] * fx + edges[7] * fy + edges[8] >= 0))
+        hits = np.flatnonzero(inside)
+        tri, fx, fy = tri[hits], fx[hits], fy[hits]
+        pixel = fy.astype(np.intp) * width + fx.astype(np.intp)
+        plane = coefficients[9:].take(tri, axis=1)
+        fragment_depth = plane[0] * fx + plane[1] * fy + plane[2]
+        return pixel, fragment_depth, ids[tri], sign[tri] > 0
+
+    def render(self, surfaces):
+        """Rasterize surface dicts (x, y, z, surfacecolor, colorscale, cmin, cmax) to (height, width, 3) uint8"""
+        meshes = []
+        for surface in surfaces:
+            x, y, z = (np.asarray(surface[k], dtype=float) for k in 'xyz')
+            meshes.append((surface, x, y, z) + self.project(x, y, z))
+
+        image = self.backdrop.copy()
+        if not meshes:
+            return image
+
+        # Buffers only cover the pixels the meshes can reach
+        px = np.concatenate([mesh[4] for mesh in meshes])
+        py = np.concatenate([mesh[5] for mesh in meshes])
+        x0 = int(np.clip(np.floor(px.min()), 0, self.width))
+        x1 = int(np.clip(np.ceil(px.max()) + 1, x0, self.width))
+        y0 = int(np.clip(np.floor(py.min()), 0, self.height))
+        y1 = int(np.clip(np.ceil(py.max()) + 1, y0, self.height))
+        window = (x0, y0, x1 - x0, y1 - y0)
+        n_pixels = window[2] * window[3]
+
+        # One z-buffer per (surface, front/back) layer, so a transparent
+        # surface is blended once for each of its sheets covering a pixel;
+        # each layer remembers the triangle it shows
+        n_layers = 2 * len(meshes)
+        zbuffer = np.full(n_layers * n_pixels, np.inf, dtype=np.float32)
+        layer_triangle = np.full(n_layers * n_pixels, -1, dtype=np.int32)
+        palette = []
+        first = 0
+        for index, (surface, x, y, z, px, py, depth) in enumerate(meshes):
+            triangles = grid_triangles(*x.shape)
+
+            # Flat colour per triangle (mean of its vertices), in grid_triangles
+            # order: the (a, b, d) triangle of every grid cell, then (a, d, c)
+            rgba = self._shade(surface, x, y, z).astype(np.float32).reshape(x.shape + (4,))
+            a, b, c, d = rgba[:-1, :-1], rgba[:-1, 1:], rgba[1:, :-1], rgba[1:, 1:]
+            palette += [((a + b + d) / 3).reshape(-1, 4), ((a + d + c) / 3).reshape(-1, 4)]
+
+            pixel, fragment_depth, tri, front = self._fragments(px, py, depth, triangles, window)
+            key = (2 * index + front) * n_pixels + pixel
+            np.minimum.at(zbuffer, key, fragment_depth)
+            nearest = np.flatnonzero(fragment_depth <= zbuffer[key])
+            layer_triangle[key[nearest]] = first + tri[nearest]
+            first += triangles.shape[1]
+        # Index -1 (no triangle) picks the transparent entry at the end
+        palette.append(np.zeros((1, 4), dtype=np.float32))
+        palette = np.concatenate(palette)
+
+        # Composite the covered pixels back to front over the scene background
+        zbuffer = zbuffer.reshape(n_layers, n_pixels)
+        layer_triangle = layer_triangle.reshape(n_layers, n_pixels)
+        covered = np.flatnonzero((layer_triangle >= 0).any(axis=0))
+        depths = zbuffer[:, covered]
+        shown = np.empty((n_layers, covered.size), dtype=np.intp)
+        columns = np.arange(covered.size)
+        for i in range(n_layers):
+            # Place of layer i back to front: the layers further away (or as
+            # far and listed before it) go first. A few comparisons per layer
+            # are much cheaper than an argsort across the layers
+            place = np.zeros(covered.size, dtype=np.intp)
+            for j in range(n_layers):
+                if j != i:
+                    place += depths[j] > depths[i] if j > i else depths[j] >= depths[i]
+            shown[place, columns] = layer_triangle[i, covered]
+
+        target = image[y0:y1, x0:x1].reshape(n_pixels, 3)
+        color = target[covered].astype(np.float32) / 255
+        for layer in shown:
+            rgba = palette[layer]
+            alpha = rgba[:, 3:]
+            color = color * (1 - alpha) + rgba[:, :3] * alpha
+        target[covered] = np.clip(color * 255 + 0.5, 0, 255).astype(np.uint8)
+        image[y0:y1, x0:x1] = target.reshape(y1 - y0, x1 - x0, 3)
+        return image
+
+
+# Frame renderer of a pool worker, installed once by the pool initializer
+_worker_render_frame = None
+
+
+def _init_rasterize_worker(render_frame):
+    """Install the frame renderer of a worker process"""
+    global _worker_render_frame
+    _worker_render_frame = render_frame
+
+
+def _rasterize_frame(render_frame, index):
+    """Render frame `index` in the worker; also returns the seconds it took"""
+    start = time.perf_counter()
+    frame = render_frame(index)
+    return frame, time.perf_counter() - start
+
+
+def _rasterize_worker_frame(index):
+    """Render frame `index` with the worker's installed renderer"""
+    return _rasterize_frame(_worker_render_frame, index)
+
+
+def rasterize_frames_parallel(render_frame, frame_indices, workers=None, instrument=None):
+    """Yield the RGB arrays render_frame(i) for each index, in frame order
+
+    Frames are rendered over a process pool (in this process when
+    workers == 1), so `render_frame` must be picklable: a module-level
+    function or a bound method of a picklable object. It is sent to each
+    worker once, when the worker starts. Per-frame render times are
+    recorded on `instrument` when one is given.
+    """
+    frame_indices = list(frame_indices)
+    if workers == 1:
+        results = (_rasterize_frame(render_frame, index) for index in frame_indices)
+        pool = None
+    elif frame_indices:
+        # Forked now, before the caller starts ffmpeg (see render_frames_parallel)
+        pool = multiprocessing.Pool(workers, initializer=_init_rasterize_worker, initargs=(render_frame,))
+        results = pool.imap(_rasterize_worker_frame, frame_indices)
+    else:
+        return iter(())
+    return _collect_frames(pool, frame_indices, results, instrument)
+
+
+def _collect_frames(pool, frame_indices, results, instrument):
+    """Yield rendered frames in frame order, then shut the pool down"""
+    try:
+        for index, (frame, seconds) in zip(frame_indices, results):
+            if instrument is not None:
+                instrument.record_frame('rasterize', index, seconds)
+            yield frame
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
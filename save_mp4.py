@@ -1,33 +1,136 @@
-# # Create temporary directory for frames
-if not os.path.exists('frames'):
-     os.makedirs('frames')
-# 
-# # Export each frame as an image
-static_traces = [trace for trace in fig.data if isinstance(trace, go.Surface)]
-# 
-for i, frame in enumerate(fig.frames):
-    # Create a new figure with current frame data
-    all_traces = list(frame.data) + static_traces
-    frame_fig = go.Figure(data=all_traces)
+import os
+import subprocess
+
+# Export the double-slit animation to MP4. Run it directly, use
+# `python cli.py export double-slit`, or call export_animation(fig) with a
+# figure from double_slit_experiment.build_figure().
+
+# Export settings
+export_mode = 'stream'  # 'stream': pipe frames straight into ffmpeg, 'png': write frames/ directory
+video_path = 'double_slit_experiment.mp4'
+framerate = 10
+crf = 23  # x264 default
+crop = None  # None, (top, bottom, left, right) margins in pixels, or 'auto'
+render_workers = os.cpu_count()  # processes rasterizing frames in parallel
+frame_cache_dir = 'frame_cache/double_slit'  # renders keyed by their inputs, so reruns only render what changed; None to disable
+
+# Build the static figure for one animation frame
+def build_frame_figure(fig, frame):
+    """Apply a frame's trace updates to the figure's traces, as plotly.js animate does"""
+    import plotly.graph_objects as go
+
+    # Frames only carry what changes (the particles in flight and which
+    # landed batches are visible); merge them into copies of the traces
+    all_traces = [type(trace)(trace) for trace in fig.data]
+    indices = frame.traces if frame.traces is not None else range(len(frame.data))
+    for index, update in zip(indices, frame.data):
+        update = update.to_plotly_json()
+        update.pop('type', None)
+        all_traces[index].update(update)
+    frame_fig = go.Figure(data=[trace for trace in all_traces if trace.visible is not False])
     # Copy layout from original figure (preserves camera, axes, scene settings)
     frame_fig.update_layout(
         title=fig.layout.title,
         scene=fig.layout.scene,
         width=fig.layout.width,
         height=fig.layout.height
-    )     
- 
-    '''frame_fig.update_layout(
-          updatemenus=[],
-          sliders=[]
-    )'''
-#     
-    # Save frame as image
-    frame_fig.write_image(f"frames/frame_{i:03d}.png", width=1000, height=700)
-    print(f"Saved frame {i+1}/{len(fig.frames)}")
-# 
-# # Use ffmpeg to create MP4 from frames
-# # Requires ffmpeg installed: https://ffmpeg.org/download.html
-os.system('ffmpeg -y -framerate 10 -i frames/frame_%03d.png -c:v libx264 -pix_fmt yuv420p double_slit_experiment.mp4')
-# 
-print("MP4 video created: double_slit_experiment.mp4")
\ No newline at end of file
+    )
+    return frame_fig
+
+# Worker entry point: frames are addressed by index
+class FrameBuilder:
+    """Builds the static figure for frame i of fig in a pool worker
+
+    Carries the figure's traces, layout and frames, so it works under any
+    multiprocessing start method; render_frames_parallel sends it to each
+    worker once.
+    """
+
+    def __init__(self, fig):
+        import plotly.graph_objects as go
+
+        self.figure = go.Figure(data=fig.data, layout=fig.layout)
+        self.frames = list(fig.frames)
+
+    def __call__(self, i):
+        return build_frame_figure(self.figure, self.frames[i])
+
+# Cache key inputs: the frame's own traces plus everything it shares
+def frame_inputs(fig, i, static_inputs):
+    """Everything that determines the rendered image of fig.frames[i]"""
+    frame = fig.frames[i]
+    return {'frame': [trace.to_plotly_json() for trace in frame.data], 'traces': frame.traces,
+            'static': static_inputs}
+
+# Unseeded trajectories change on every run, so their renders never match the cache
+def frame_cache_for(seeded, frame_cache_dir=frame_cache_dir):
+    """frame_cache_dir, or None (with a note) when the trajectories are not reproducible"""
+    if frame_cache_dir is not None and not seeded:
+        print("Frame cache skipped: no random seed is set, so every run draws new trajectories "
+              "(set random_seed or pass --seed to reuse renders)")
+        return None
+    return frame_cache_dir
+
+def export_animation(fig, video_path=video_path, export_mode=export_mode, framerate=framerate,
+                     crf=crf, crop=crop, workers=render_workers, frame_cache_dir=frame_cache_dir,
+                     instrument=None):
+    """Render every frame of fig to an MP4 (or a frames/ directory)"""
+    from video_export import (FFmpegWriter, FrameCache, crop_rendered, encode_png, input_key,
+                              render_frames_parallel, write_if_changed)
+
+    build_frame = FrameBuilder(fig)
+
+    # # Create temporary directory for frames
+    if export_mode == 'png' and not os.path.exists('frames'):
+         os.makedirs('frames')
+
+    # Frames are rasterized by a pool of workers and collected in order; with
+    # a frame cache, only frames without a stored render are rasterized
+    if frame_cache_dir is None:
+        rendered = render_frames_parallel(build_frame, range(len(fig.frames)),
+                                          width=1000, height=700, workers=workers, instrument=instrument)
+    else:
+        cache = FrameCache(frame_cache_dir)
+        layout = fig.layout.to_plotly_json()
+        # Hashed once: frames only update part of the traces, so every
+        # frame depends on all of them
+        static_inputs = input_key({
+            'traces': [trace.to_plotly_json() for trace in fig.data],
+            'layout': {key: layout.get(key) for key in ('title', 'scene', 'width', 'height')},
+            'size': [1000, 700],
+        })
+        keys = [cache.key(frame_inputs(fig, i, static_inputs)) for i in range(len(fig.frames))]
+        rendered = cache.render(build_frame, keys, width=1000, height=700,
+                                workers=workers, instrument=instrument)
+
+    if export_mode == 'stream':
+        # Frames go through memory into a single ffmpeg process, no PNG files
+        with FFmpegWriter(video_path, framerate=framerate, crf=crf) as writer:
+            for i, frame in enumerate(crop_rendered(rendered, crop)):
+                writer.write(frame)
+                print(f"Encoded frame {i+1}/{len(fig.frames)}")
+    else:
+        # Save frames as images, cropped before they touch disk; files that
+        # already hold the same image are left untouched
+        if crop is None:
+            frames = rendered
+        else:
+            frames = (encode_png(frame) for frame in crop_rendered(rendered, crop))
+        for i, png_bytes in enumerate(frames):
+            written = write_if_changed(f"frames/frame_{i:03d}.png", png_bytes)
+            print(f"{'Saved' if written else 'Unchanged'} frame {i+1}/{len(fig.frames)}")
+
+        # Use ffmpeg to create MP4 from frames (https://ffmpeg.org/download.html)
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(framerate),
+                        '-i', 'frames/frame_%03d.png', '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+                        '-crf', str(crf), video_path], check=True)
+    print(f"MP4 video created: {video_path}")
+
+def main():
+    """Build the double-slit animation and export it with the settings above"""
+    from double_slit_experiment import build_figure, random_seed
+
+    export_animation(build_figure(), frame_cache_dir=frame_cache_for(random_seed is not None))
+
+if __name__ == '__main__':
+    main()
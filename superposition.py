@@ -1,35 +1,89 @@
+import os
 import numpy as np
-import plotly.graph_objects as go
-from scipy.special import sph_harm_y
+from harmonic_cache import SYMMETRY_PRESETS, HarmonicCache
+from instrumentation import NULL_INSTRUMENT, Instrumentation
 
 # Install required packages (run once):
 # pip install kaleido plotly-orca psutil pillow
-
-# Create spherical coordinates
-theta = np.linspace(0, 2 * np.pi, 150)  # azimuthal angle
-phi = np.linspace(0, np.pi, 150)        # polar angle
-theta, phi = np.meshgrid(theta, phi)
+#
+# Importing this module is cheap: plotly and scipy are only loaded when a
+# figure is built or a harmonic is evaluated. Run it directly, or use
+# `python cli.py preview|export superposition` for headless jobs.
 
 # Base sphere radius
 r_base = 1
 
-# Tetrahedral symmetry parameters
+# Harmonic of the default waves: degree l and orders m (|m| <= l), summed
 l = 3  # degree
-m_values = [-3, 3]  # orders for tetrahedral symmetry
+m_values = [3]  # orders; Y_3^3 varies as cos 3θ, the 3-fold pattern of the original animation
 
 # Animation parameters
 num_frames = 60
 amplitude = 0.5  # Oscillation amplitude
 spin_speed = 0.5  # Rotation speed multiplier (0.5 = half speed)
 
-# Calculate spherical harmonics (constant for all frames)
-Y_3m3 = sph_harm_y(-3, 3, phi, theta)
-Y_3p3 = sph_harm_y(3, 3, phi, theta)
-Y_tet = Y_3m3 + Y_3p3
-Y_tet_real = np.real(Y_tet)
+# Wave components, one sphere each. Sphere k has radius
+#   r_base + amplitude * cos(frequency * t + phase) * Re(sum of its terms)
+# and turns about Z by spin * t, with t going from 0 to 2π over the
+# animation. Terms are (l, m) or (l, m, weight) for weight * sph_harm_y(l, m),
+# or the name of a harmonic_cache.SYMMETRY_PRESETS combination. None gives
+# the two counter-rotating waves built from l, m_values, amplitude and
+# spin_speed above; for example
+#   waves = [
+#       {'terms': 'tetrahedral', 'amplitude': 0.5, 'spin': 0.5},
+#       {'terms': 'legacy', 'amplitude': 0.5, 'phase': np.pi, 'spin': -0.5},
+#       {'terms': [(2, 0)], 'amplitude': 0.3, 'frequency': 2},
+#   ]
+waves = None
+frame_chunk_mb = 4  # radial fields of a batch of frames, computed in one einsum; None for all frames at once
+
+# Instrumentation: set report_path to write per-stage and per-frame timings as JSON
+report_path = None  # e.g. 'render_report.json'
+profile = False  # also capture a cProfile of the run (saved next to the report as .prof)
+trace_memory = False  # also record the peak traced memory of every stage
+
+# Grid resolution: a fixed number of points per axis, or 'auto' to pick it
+# from the output size and the harmonic degree
+grid_resolution = 150
+target_pixels = None  # rendered width of the scene; None for the larger side of export_size
+max_error_px = 0.5  # allowed radial error of the mesh, in pixels
+
+# Level of detail for the sphere mesh
+def choose_grid_resolution(l, target_pixels, pattern_bound, max_error_px=0.5,
+                           min_points=16, max_points=1024, r_base=r_base, amplitude=amplitude):
+    """Pick (n_theta, n_phi, error_px) for degree l rendered target_pixels wide"""
+    # Nyquist: Y_lm oscillates at most l times around the azimuth and over the polar range
+    nyquist_theta = 2 * l + 1
+    nyquist_phi = l + 1
+
+    # Axes span +-1.1 * max_radius, so this is the size of one pixel in scene units
+    radius_bound = r_base + amplitude * pattern_bound
+    pixel = 2.2 * radius_bound / target_pixels
+
+    # Piecewise-linear mesh with spacing h misses the surface by about
+    # curvature * h^2 / 8, where the curvature of r_base + A * Y_lm is
+    # bounded by r_base + A * |Y|max * l(l+1)
+    curvature = r_base + amplitude * pattern_bound * l * (l + 1)
+    h = np.sqrt(8 * max_error_px * pixel / curvature)
 
-# Calculate the maximum radius to set fixed axis limits
-max_radius = r_base + amplitude * np.max(np.abs(Y_tet_real))
+    n_theta = int(np.clip(max(nyquist_theta, np.ceil(2 * np.pi / h) + 1), min_points, max_points))
+    n_phi = int(np.clip(max(nyquist_phi, np.ceil(np.pi / h) + 1), min_points, max_points))
+
+    # Error estimate for the spacing actually used
+    h_used = max(2 * np.pi / (n_theta - 1), np.pi / (n_phi - 1))
+    error_px = curvature * h_used ** 2 / 8 / pixel
+    return n_theta, n_phi, error_px
+
+# Rotational symmetry of the radial pattern
+def azimuthal_symmetry(pattern, tol=1e-9):
+    """Order k of the pattern's k-fold symmetry about the Z axis (0 if axisymmetric)
+
+    pattern is sampled on theta = linspace(0, 2π, n) along axis 1; k is the
+    gcd of the azimuthal frequencies present in it.
+    """
+    spectrum = np.abs(np.fft.rfft(pattern[:, :-1], axis=1)).max(axis=0)
+    frequencies = np.flatnonzero(spectrum[1:] > tol * spectrum.max()) + 1
+    return int(np.gcd.reduce(frequencies)) if frequencies.size else 0
 
 # Function to create RGBA colorscale with variable alpha
 def create_transparent_colorscale(base_colorscale, min_alpha=0.3, max_alpha=0.9):
@@ -39,6 +93,10 @@ def create_transparent_colorscale(base_colorscale, min_alpha=0.3, max_alpha=0.9)
         colors = ['#440154', '#31688e', '#35b779', '#fde724']
     elif base_colorscale == 'Plasma':
         colors = ['#0d0887', '#7e03a8', '#cc4778', '#f89540', '#f0f921']
+    elif base_colorscale == 'Cividis':
+        colors = ['#00224e', '#575d6d', '#a59c74', '#fee838']
+    elif base_colorscale == 'Inferno':
+        colors = ['#000004', '#781c6d', '#ed6925', '#fcffa4']
     else:
         colors = ['#0d0887', '#7e03a8', '#cc4778', '#f89540', '#f0f921']
     
@@ -58,258 +116,569 @@ def create_transparent_colorscale(base_colorscale, min_alpha=0.3, max_alpha=0.9)
     
     return colorscale
 
-# Rotation matrix around Z axis
-def rotate_z(x, y, z, angle):
-    """Rotate points around Z axis"""
-    x_rot = x * np.cos(angle) - y * np.sin(angle)
-    y_rot = x * np.sin(angle) + y * np.cos(angle)
-    z_rot = z
-    return x_rot, y_rot, z_rot
-
-# Create transparent colorscales
-colorscale1 = create_transparent_colorscale('Viridis', min_alpha=0.4, max_alpha=0.9)
-colorscale2 = create_transparent_colorscale('Plasma', min_alpha=0.4, max_alpha=0.9)
-
-# Create frames for animation
-frames = []
-for i in range(num_frames):
-    # Time variable for oscillation
-    t = i * 2 * np.pi / num_frames
-    
-    # Rotation angles (opposite directions)
-    angle1 = spin_speed * t  # Clockwise rotation
-    angle2 = -spin_speed * t  # Counter-clockwise rotation
-    
-    # First sphere - original phase with oscillation
-    r_perturbation1 = amplitude * Y_tet_real * np.cos(t)
-    r1 = r_base + r_perturbation1
-    
-    # Convert to Cartesian coordinates for sphere 1
-    x1 = r1 * np.sin(phi) * np.cos(theta)
-    y1 = r1 * np.sin(phi) * np.sin(theta)
-    z1 = r1 * np.cos(phi)
-    
-    # Rotate sphere 1
-    x1_rot, y1_rot, z1_rot = rotate_z(x1, y1, z1, angle1)
-    
-    # Second sphere - 180° phase shift with oscillation
-    r_perturbation2 = amplitude * Y_tet_real * np.cos(t + np.pi)
-    r2 = r_base + r_perturbation2
-    
-    # Convert to Cartesian coordinates for sphere 2
-    x2 = r2 * np.sin(phi) * np.cos(theta)
-    y2 = r2 * np.sin(phi) * np.sin(theta)
-    z2 = r2 * np.cos(phi)
-    
-    # Rotate sphere 2 (opposite direction)
-    x2_rot, y2_rot, z2_rot = rotate_z(x2, y2, z2, angle2)
-    
-    frames.append(go.Frame(
-        data=[
-            go.Surface(
-                x=x1_rot, y=y1_rot, z=z1_rot,
-                colorscale=colorscale1,
-                showscale=False,
-                surfacecolor=Y_tet_real,
-                cmin=Y_tet_real.min(),
-                cmax=Y_tet_real.max(),
-                name='Sphere 1'
+# Colorscales of the wave spheres, in order (repeated beyond four waves)
+wave_colorscales = ['Viridis', 'Plasma', 'Cividis', 'Inferno']
+
+# Wave components
+def wave_component(terms, amplitude=amplitude, phase=0.0, frequency=1.0, spin=0.0):
+    """A wave component with every field filled in and terms as (l, m, weight) (see waves above)"""
+    if isinstance(terms, str):
+        if terms not in SYMMETRY_PRESETS:
+            raise ValueError(f"unknown symmetry preset {terms!r}, choose from {', '.join(SYMMETRY_PRESETS)}")
+        terms = SYMMETRY_PRESETS[terms]
+    terms = [(int(term[0]), int(term[1]), float(term[2]) if len(term) > 2 else 1.0) for term in terms]
+    for term_l, m, _ in terms:
+        # sph_harm_y(l, m) is zero everywhere outside 0 <= |m| <= l: the sphere would stay blank
+        if abs(m) > term_l:
+            raise ValueError(f"invalid harmonic (l={term_l}, m={m}): the order must satisfy |m| <= l")
+    return {
+        'terms': terms,
+        'amplitude': float(amplitude),
+        'phase': float(phase),
+        'frequency': float(frequency),
+        'spin': float(spin),
+    }
+
+def default_waves(l=l, m_values=m_values, amplitude=amplitude, spin_speed=spin_speed):
+    """The two waves of the original animation: in antiphase, rotating in opposite directions
+
+    Both sum the degree l harmonics of the orders m_values; the defaults
+    (l = 3, m = 3) are the 'legacy' preset.
+    """
+    terms = [(l, m) for m in m_values]
+    return [
+        wave_component(terms, amplitude, phase=0.0, spin=spin_speed),
+        wave_component(terms, amplitude, phase=np.pi, spin=-spin_speed),
+    ]
+
+# Unit-sphere geometry shared by every frame
+class SphereGeometry:
+    """Cache the unit direction vectors of a (theta, phi) grid"""
+
+    def __init__(self, theta, phi):
+        # Horizontal direction stored as x + iy so a Z rotation is one complex multiply
+        self.horizontal = np.sin(phi) * np.exp(1j * theta)
+        self.vertical = np.cos(phi)
+
+    def surface(self, r, angle):
+        """Scale the unit sphere by r and rotate it around the Z axis"""
+        rotated = self.horizontal * np.exp(1j * angle)
+        return r * rotated.real, r * rotated.imag, r * self.vertical
+
+# Everything that is constant across frames, computed once
+class SphereAnimation:
+    """Spheres perturbed by oscillating, rotating harmonic waves
+
+    By default two counter-rotating spheres with the 'legacy' pattern;
+    waves declares any number of components instead (see waves above).
+    Holds the grid, the wave patterns and the colorscales; frames are
+    computed on demand. Instances are picklable, so bound methods can be
+    used as frame builders; the render pools send them to each worker
+    once (about 1.6 MB per animation on the default grid).
+    """
+
+    # Size of the rendered video frames
+    export_size = (900, 900)
+
+    def __init__(self, grid_resolution=grid_resolution, r_base=r_base, amplitude=amplitude,
+                 spin_speed=spin_speed, num_frames=num_frames, l=l, m_values=m_values, waves=waves,
+                 frame_chunk_mb=frame_chunk_mb, target_pixels=target_pixels, max_error_px=max_error_px,
+                 harmonics=None, instrument=NULL_INSTRUMENT):
+        self.l = l
+        self.m_values = list(m_values)
+        self.grid_resolution = grid_resolution
+        self.r_base = r_base
+        self.amplitude = amplitude
+        self.spin_speed = spin_speed
+        self.num_frames = num_frames
+        self.frame_chunk_mb = frame_chunk_mb
+        self.target_pixels = max(self.export_size) if target_pixels is None else target_pixels
+        self.max_error_px = max_error_px
+
+        if waves is None:
+            self.waves = default_waves(l, self.m_values, amplitude, spin_speed)
+        else:
+            self.waves = [wave_component(**wave) for wave in waves]
+        if not self.waves:
+            raise ValueError("at least one wave component is required")
+        # Distinct (l, m) harmonics of all waves: the basis their patterns are summed from
+        terms = list(dict.fromkeys((term_l, m) for wave in self.waves for term_l, m, _ in wave['terms']))
+
+        if grid_resolution == 'auto':
+            # |Y_lm| <= sqrt((2l + 1) / 4π) for each summed term
+            l_max = max((abs(term_l) for term_l, _ in terms), default=0)
+            pattern_bound = max(sum(abs(weight) * np.sqrt((2 * abs(term_l) + 1) / (4 * np.pi))
+                                    for term_l, _, weight in wave['terms'])
+                                for wave in self.waves)
+            amplitude_bound = max(abs(wave['amplitude']) for wave in self.waves)
+            n_theta, n_phi, error_px = choose_grid_resolution(l_max, self.target_pixels, pattern_bound,
+                                                              max_error_px, r_base=r_base, amplitude=amplitude_bound)
+            # Whole number of theta steps per symmetry sector, so rotated frames can be reused
+            order = int(np.gcd.reduce([abs(m) for _, m in terms])) if terms else 0
+            if order > 1:
+                n_theta = -(-(n_theta - 1) // order) * order + 1
+            print(f"LOD grid: {n_theta} x {n_phi} (theta x phi) for l = {l_max} at {self.target_pixels}px, "
+                  f"estimated max radial error {error_px:.2f}px")
+        else:
+            n_theta = n_phi = grid_resolution
+
+        # Create spherical coordinates
+        theta = np.linspace(0, 2 * np.pi, n_theta)  # azimuthal angle
+        phi = np.linspace(0, np.pi, n_phi)          # polar angle
+        self.theta, self.phi = np.meshgrid(theta, phi)
+
+        # Calculate spherical harmonics (constant for all frames), reusing the
+        # on-disk cache from previous runs with the same grid
+        harmonics = HarmonicCache() if harmonics is None else harmonics
+        with instrument.span('harmonics'):
+            basis = np.array([np.real(harmonics.sph_harm_y(term_l, m, self.phi, self.theta))
+                              for term_l, m in terms]).reshape(len(terms), *self.theta.shape)
+        # Each wave's pattern is the weighted sum of its terms: (waves x terms) weights against the basis
+        weights = np.zeros((len(self.waves), len(terms)))
+        for w, wave in enumerate(self.waves):
+            for term_l, m, weight in wave['terms']:
+                weights[w, terms.index((term_l, m))] += weight
+        self.patterns = np.einsum('wk,kpq->wpq', weights, basis)
+
+        # Per-wave parameters as arrays, for whole batches of frames
+        self.amplitudes = np.array([wave['amplitude'] for wave in self.waves])
+        self.phases = np.array([wave['phase'] for wave in self.waves])
+        self.frequencies = np.array([wave['frequency'] for wave in self.waves])
+        self.spins = np.array([wave['spin'] for wave in self.waves])
+
+        # Calculate the maximum radius to set fixed axis limits
+        self.max_radius = r_base + max(abs(wave['amplitude']) * np.max(np.abs(pattern))
+                                       for wave, pattern in zip(self.waves, self.patterns))
+
+        self.geometry = SphereGeometry(self.theta, self.phi)
+
+        # Create transparent colorscales
+        self.colorscales = [
+            create_transparent_colorscale(wave_colorscales[k % len(wave_colorscales)], min_alpha=0.4, max_alpha=0.9)
+            for k in range(len(self.waves))
+        ]
+
+        # Radial perturbation patterns and their colour ranges (constant for all frames)
+        self.radial_patterns = self.amplitudes[:, None, None] * self.patterns
+        self.color_ranges = [(pattern.min(), pattern.max()) for pattern in self.patterns]
+
+        # The default pattern is 3-fold symmetric about Z (Y_3^3 varies
+        # as cos 3θ), so spheres rotated by 2π/3 look the same. A rotation
+        # that all patterns share is symmetry_order-fold
+        self.symmetry_orders = [azimuthal_symmetry(pattern) for pattern in self.patterns]
+        self.symmetry_order = int(np.gcd.reduce(self.symmetry_orders))
+
+    def frame_times(self, frames):
+        """Time variable (0 to 2π over the animation) of each frame index"""
+        return np.asarray(frames) * 2 * np.pi / self.num_frames
+
+    def radial_fields(self, frames):
+        """Radii of every wave sphere in the given frames, shape (frames, waves, n_phi, n_theta)
+
+        One einsum of the radial patterns against the (frames x waves)
+        matrix of oscillation factors cos(frequency * t + phase).
+        """
+        oscillation = np.cos(np.multiply.outer(self.frame_times(frames), self.frequencies) + self.phases)
+        return self.r_base + np.einsum('fw,wpq->fwpq', oscillation, self.radial_patterns)
+
+    def chunk_frames(self):
+        """Frames whose radial fields fit in frame_chunk_mb, or None without a limit"""
+        if self.frame_chunk_mb is None:
+            return None
+        frame_bytes = 8 * self.patterns.size
+        return max(1, int(self.frame_chunk_mb * 1e6 // frame_bytes))
+
+    def compute_frames(self, frames, chunk=None):
+        """Yield the rotated (x, y, z) surfaces of every sphere for each of the given frames
+
+        Radial fields are computed chunk frames at a time (default:
+        chunk_frames()), so memory is bounded by the chunk rather than the
+        frame count. Each sphere is then rotated one frame at a time, which
+        keeps the larger rotation temporaries in cache.
+        """
+        frames = list(frames)
+        chunk = chunk or self.chunk_frames() or max(len(frames), 1)
+        for start in range(0, len(frames), chunk):
+            batch = frames[start:start + chunk]
+            radii = self.radial_fields(batch)
+            # Each sphere turns by spin * t, the waves with opposite spins in opposite directions
+            angles = np.multiply.outer(self.frame_times(batch), self.spins)
+            for k in range(len(batch)):
+                yield [self.geometry.surface(radii[k, w], angles[k, w]) for w in range(len(self.waves))]
+
+    def compute_frame(self, i):
+        """Return the rotated (x, y, z) surfaces of every sphere for frame i"""
+        return next(self.compute_frames([i]))
+
+    def surfaces(self, *spheres):
+        """Surface properties (geometry, colours) of every sphere, shared by every renderer"""
+        return [
+            dict(
+                x=sphere[0], y=sphere[1], z=sphere[2],
+                colorscale=colorscale,
+                surfacecolor=pattern,
+                cmin=color_range[0],
+                cmax=color_range[1]
+            )
+            for sphere, colorscale, pattern, color_range
+            in zip(spheres, self.colorscales, self.patterns, self.color_ranges)
+        ]
+
+    def trace_specs(self, *spheres):
+        """The surface traces as plain dicts; every frame shares the same surfacecolor arrays"""
+        return [
+            dict(surface, type='surface', showscale=False, name=f'Sphere {k}')
+            for k, surface in enumerate(self.surfaces(*spheres), 1)
+        ]
+
+    def sphere_traces(self, *spheres):
+        """Build the go.Surface traces from computed sphere surfaces"""
+        import plotly.graph_objects as go
+
+        return [go.Surface(spec) for spec in self.trace_specs(*spheres)]
+
+    def scene(self):
+        """Scene layout with fixed axis ranges, shared by preview and export"""
+        axis_range = [-self.max_radius * 1.1, self.max_radius * 1.1]
+        return dict(
+            xaxis=dict(title='X', range=axis_range, autorange=False),
+            yaxis=dict(title='Y', range=axis_range, autorange=False),
+            zaxis=dict(title='Z', range=axis_range, autorange=False),
+            aspectmode='cube',
+            camera=dict(
+                eye=dict(x=1.8, y=1.8, z=1.8)
             ),
-            go.Surface(
-                x=x2_rot, y=y2_rot, z=z2_rot,
-                colorscale=colorscale2,
-                showscale=False,
-                surfacecolor=Y_tet_real,
-                cmin=Y_tet_real.min(),
-                cmax=Y_tet_real.max(),
-                name='Sphere 2'
+            bgcolor='rgba(240, 240, 240, 1)'
+        )
+
+    def figure_layout(self):
+        """Layout of the interactive figure, in the canonical form plain-dict figures need"""
+        scene = self.scene()
+        for axis in ('xaxis', 'yaxis', 'zaxis'):
+            scene[axis]['title'] = {'text': scene[axis]['title']}
+        return dict(
+            title={'text': 'Spinning Spheres with Tetrahedral Symmetry'},
+            scene=scene,
+            width=900,
+            height=900,
+            updatemenus=[{
+                'type': 'buttons',
+                'showactive': False,
+                'x': 0.1,
+                'y': 0.9,
+                'buttons': [
+                    {
+                        'label': 'Play',
+                        'method': 'animate',
+                        'args': [None, {
+                            'frame': {'duration': 240, 'redraw': True},
+                            'fromcurrent': True,
+                            'mode': 'immediate',
+                            'transition': {'duration': 0}
+                        }]
+                    },
+                    {
+                        'label': 'Pause',
+                        'method': 'animate',
+                        'args': [[None], {
+                            'frame': {'duration': 0, 'redraw': False},
+                            'mode': 'immediate',
+                            'transition': {'duration': 0}
+                        }]
+                    }
+                ]
+            }]
+        )
+
+    def frame_spec(self, i):
+        """Animation frame i as a plain dict"""
+        return {'data': self.trace_specs(*self.compute_frame(i)), 'name': str(i)}
+
+    def frame_specs(self):
+        """Every animation frame as a plain dict, computed in batches"""
+        for i, spheres in enumerate(self.compute_frames(range(self.num_frames))):
+            yield {'data': self.trace_specs(*spheres), 'name': str(i)}
+
+    def figure_spec(self, with_frames=True):
+        """The interactive figure as a FigureSpec: plain dicts, no validation
+
+        Frames are computed while the spec is being written (or when
+        spec.frames[i] is read), so write_html/write_json hold one frame
+        at a time.
+        """
+        from figure_writer import FigureSpec, LazyFrames
+
+        frames = LazyFrames(self.frame_spec, self.num_frames, self.frame_specs) if with_frames else ()
+        return FigureSpec(self.frame_spec(0)['data'], self.figure_layout(), frames)
+
+    def build_figure(self, with_frames=True, instrument=NULL_INSTRUMENT):
+        """Interactive figure with Play/Pause and, by default, one go.Frame per time step"""
+        import plotly.graph_objects as go
+
+        # Create frames for animation
+        frames = []
+        with instrument.span('frames'):
+            # Geometry is computed in batches, timed on the first frame of each
+            geometry = self.compute_frames(range(self.num_frames if with_frames else 1))
+            for i in range(self.num_frames if with_frames else 1):
+                with instrument.frame_span('geometry', i):
+                    spheres = next(geometry)
+                # go.Frame construction includes plotly's validation of every trace
+                with instrument.frame_span('traces', i):
+                    frames.append(go.Frame(data=self.sphere_traces(*spheres), name=str(i)))
+
+        # Create figure with animation (initial state is frame 0: t = 0, no rotation)
+        with instrument.span('figure'):
+            fig = go.Figure(
+                data=frames[0].data,
+                frames=frames if with_frames else None
             )
-        ],
-        name=str(i)
-    ))
-
-# Create initial frame
-t = 0
-angle1 = 0
-angle2 = 0
-
-# Sphere 1
-r_perturbation1 = amplitude * Y_tet_real * np.cos(t)
-r1 = r_base + r_perturbation1
-x1 = r1 * np.sin(phi) * np.cos(theta)
-y1 = r1 * np.sin(phi) * np.sin(theta)
-z1 = r1 * np.cos(phi)
-x1_rot, y1_rot, z1_rot = rotate_z(x1, y1, z1, angle1)
-
-# Sphere 2 (180° phase shift)
-r_perturbation2 = amplitude * Y_tet_real * np.cos(t + np.pi)
-r2 = r_base + r_perturbation2
-x2 = r2 * np.sin(phi) * np.cos(theta)
-y2 = r2 * np.sin(phi) * np.sin(theta)
-z2 = r2 * np.cos(phi)
-x2_rot, y2_rot, z2_rot = rotate_z(x2, y2, z2, angle2)
-
-# Create figure with animation
-fig = go.Figure(
-    data=[
-        go.Surface(
-            x=x1_rot, y=y1_rot, z=z1_rot,
-            colorscale=colorscale1,
-            showscale=False,
-            surfacecolor=Y_tet_real,
-            cmin=Y_tet_real.min(),
-            cmax=Y_tet_real.max(),
-            name='Sphere 1'
-        ),
-        go.Surface(
-            x=x2_rot, y=y2_rot, z=z2_rot,
-            colorscale=colorscale2,
-            showscale=False,
-            surfacecolor=Y_tet_real,
-            cmin=Y_tet_real.min(),
-            cmax=Y_tet_real.max(),
-            name='Sphere 2'
+
+        # Add animation controls with fixed axis ranges
+        fig.update_layout(self.figure_layout())
+        return fig
+
+    def export_figure(self, i):
+        """Create a standalone figure for video frame i"""
+        import plotly.graph_objects as go
+
+        fig_frame = go.Figure(data=self.sphere_traces(*self.compute_frame(i)))
+        fig_frame.update_layout(
+            scene=self.scene(),
+            width=self.export_size[0],
+            height=self.export_size[1],
+            showlegend=False
         )
-    ],
-    frames=frames
-)
-
-# Add animation controls with fixed axis ranges
-fig.update_layout(
-    title='Spinning Spheres with Tetrahedral Symmetry',
-    scene=dict(
-        xaxis=dict(
-            title='X',
-            range=[-max_radius * 1.1, max_radius * 1.1],
-            autorange=False
-        ),
-        yaxis=dict(
-            title='Y',
-            range=[-max_radius * 1.1, max_radius * 1.1],
-            autorange=False
-        ),
-        zaxis=dict(
-            title='Z',
-            range=[-max_radius * 1.1, max_radius * 1.1],
-            autorange=False
-        ),
-        aspectmode='cube',
-        camera=dict(
-            eye=dict(x=1.8, y=1.8, z=1.8)
-        ),
-        bgcolor='rgba(240, 240, 240, 1)'
-    ),
-    width=900,
-    height=900,
-    updatemenus=[{
-        'type': 'buttons',
-        'showactive': False,
-        'x': 0.1,
-        'y': 0.9,
-        'buttons': [
-            {
-                'label': 'Play',
-                'method': 'animate',
-                'args': [None, {
-                    'frame': {'duration': 240, 'redraw': True},
-                    'fromcurrent': True,
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            },
-            {
-                'label': 'Pause',
-                'method': 'animate',
-                'args': [[None], {
-                    'frame': {'duration': 0, 'redraw': False},
-                    'mode': 'immediate',
-                    'transition': {'duration': 0}
-                }]
-            }
-        ]
-    }]
-)
+        return fig_frame
+
+    def rasterizer(self):
+        """NumPy rasterizer with the camera, axis ranges and colours of export_figure"""
+        from rasterizer import SurfaceRasterizer
+
+        axis_range = self.scene()['xaxis']['range']
+        return SurfaceRasterizer(width=self.export_size[0], height=self.export_size[1],
+                                 ranges=[axis_range] * 3, eye=(1.8, 1.8, 1.8),
+                                 background=(240, 240, 240))
+
+    def rasterize_frame(self, i):
+        """Render video frame i to an RGB array without plotly (no axes or titles)"""
+        # One rasterizer per process, made on its first frame: it keeps the
+        # backdrop and colour lookups between frames
+        if getattr(self, '_rasterizer', None) is None:
+            self._rasterizer = self.rasterizer()
+        return self._rasterizer.render(self.surfaces(*self.compute_frame(i)))
+
+    def rotation_period(self, order=None):
+        """Smallest Z rotation that maps a pattern with order-fold symmetry and the mesh onto themselves
+
+        order defaults to the symmetry shared by every wave pattern.
+        """
+        # A rotation by whole theta steps maps the mesh onto itself, so the
+        # pattern's symmetry is only exact when it is a multiple of the step
+        intervals = self.theta.shape[1] - 1
+        order = self.symmetry_order if order is None else order
+        return 2 * np.pi / np.gcd(order or intervals, intervals)
+
+    def frame_state(self, i):
+        """Canonical state of frame i: frames with equal states render identically
+
+        Each sphere's radii depend on its oscillation factor
+        cos(frequency * t + phase) only, and its rotation is taken modulo
+        the rotation_period() of its own pattern.
+        """
+        t = i * 2 * np.pi / self.num_frames
+
+        def turn(angle, period):
+            # Fraction of the period, rounded so float noise cannot split states
+            return round((angle / period) % 1.0, 9) % 1.0
+
+        oscillation = np.cos(self.frequencies * t + self.phases)
+        return (tuple(round(float(c), 12) + 0.0 for c in oscillation)
+                + tuple(turn(spin * t, self.rotation_period(order))
+                        for spin, order in zip(self.spins, self.symmetry_orders)))
+
+    def distinct_states(self):
+        """Number of distinct frame_state()s; num_frames when no two frames look the same
+
+        That is the case for the 3-fold default pattern on 150 theta points:
+        no rotation short of a full turn maps it onto the grid (see
+        rotation_period), so every spinning frame is new.
+        """
+        return len({self.frame_state(i) for i in range(self.num_frames)})
+
+    def frame_inputs(self, i, canonical=True):
+        """Everything that determines the rendered image of video frame i
 
-# Show the figure
-fig.show()
+        With canonical=True the time and rotations are replaced by
+        frame_state(i), so frames that look the same get the same inputs.
+        """
+        inputs = {
+            'grid': list(self.theta.shape),
+            'patterns': self.patterns,
+            'r_base': self.r_base,
+            'amplitudes': self.amplitudes,
+            'colorscales': self.colorscales,
+            'scene': self.scene(),
+            'size': list(self.export_size),
+        }
+        if canonical:
+            inputs['state'] = self.frame_state(i)
+        else:
+            inputs.update(waves=self.waves, t=i * 2 * np.pi / self.num_frames)
+        return inputs
+
+# ============================================
+# PREVIEW
+# ============================================
+
+# Preview settings
+preview_mode = 'frames'  # 'frames': fig.show() with every go.Frame, 'client': compact HTML animated in the browser
+html_path = 'spheres_animation.html'
+float32_payload = False  # send trace arrays to the browser as float32 typed arrays
+
+def preview(animation, fig=None, mode=preview_mode, html_path=html_path,
+            float32_payload=float32_payload, open_browser=True):
+    """Show the animation in the browser, or with open_browser=False only write it to html_path"""
+    if mode == 'client':
+        # Geometry and the wave patterns are written once; the browser computes the frames
+        from html_export import write_harmonic_animation_html
+        if fig is None:
+            fig = animation.build_figure(with_frames=False)
+        waves = [dict(wave, pattern=pattern) for wave, pattern in zip(animation.waves, animation.patterns)]
+        write_harmonic_animation_html(fig, html_path, animation.theta[0], animation.phi[:, 0], waves,
+                                      animation.r_base, animation.num_frames)
+        print(f"Preview written to {html_path}")
+        if open_browser:
+            import webbrowser
+            webbrowser.open('file://' + os.path.abspath(html_path))
+        return
+
+    import plotly.io as pio
+    from figure_writer import FigureSpec
+
+    if fig is None:
+        # Plain dicts instead of go.Frames: no validation, and frames are
+        # computed while the page is written
+        fig = animation.figure_spec()
+    if float32_payload:
+        from figure_encoding import compact_figure
+        fig = compact_figure(fig)
+    if open_browser:
+        pio.show(fig, validate=False)
+    elif isinstance(fig, FigureSpec):
+        fig.write_html(html_path)
+        print(f"Preview written to {html_path}")
+    else:
+        pio.write_html(fig, html_path, validate=False)
+        print(f"Preview written to {html_path}")
 
 # ============================================
 # SAVE ANIMATION TO MP4
 # ============================================
 
-print("Saving animation frames...")
+# Export settings
+export_mode = 'stream'  # 'stream': pipe frames straight into ffmpeg, 'png': write frames/ directory
+video_path = 'spheres_animation.mp4'
+framerate = 20
+crf = 18
+crop = None  # None, (top, bottom, left, right) margins in pixels, e.g. (250, 250, 200, 200), or 'auto'
+crop_background = [(255, 255, 255), (240, 240, 240)]  # paper and scene colours ignored by crop = 'auto'
+render_workers = os.cpu_count()  # processes rasterizing frames in parallel
+frame_cache_dir = 'frame_cache/spheres'  # renders keyed by their inputs, so reruns only render what changed; None to disable
+deduplicate_frames = True  # render frames with the same phase and rotation (modulo the symmetry) once
+renderer = 'plotly'  # 'plotly': kaleido renders export_figure, 'numpy': built-in z-buffer rasterizer (no axes, much faster)
 
-# Method 1: Using PIL to create frames and then ffmpeg
-from PIL import Image
-import io
-import os
+def export(animation, video_path=video_path, export_mode=export_mode, framerate=framerate, crf=crf,
+           crop=crop, crop_background=crop_background, workers=render_workers,
+           frame_cache_dir=frame_cache_dir, deduplicate=deduplicate_frames, renderer=renderer,
+           instrument=NULL_INSTRUMENT):
+    """Render every frame of the animation to an MP4 (or a frames/ directory)"""
+    from video_export import (FFmpegWriter, FrameCache, crop_rendered, encode_png, input_key, png_to_rgb,
+                              render_deduplicated, render_frames_parallel, write_if_changed)
 
-# Create a directory for frames
-if not os.path.exists('frames'):
-    os.makedirs('frames')
+    print("Saving animation frames...")
+    num_frames = animation.num_frames
+    if renderer == 'numpy':
+        # RGB arrays straight from the rasterizer: no figures, PNGs, frame cache or deduplication
+        from rasterizer import rasterize_frames_parallel
+        rendered = rasterize_frames_parallel(animation.rasterize_frame, range(num_frames),
+                                             workers=workers, instrument=instrument)
+        decode = np.asarray
+    else:
+        cache = None if frame_cache_dir is None else FrameCache(frame_cache_dir)
+        key = input_key if cache is None else cache.key
 
-# Save each frame as an image
-for i in range(num_frames):
-    t = i * 2 * np.pi / num_frames
-    angle1 = spin_speed * t
-    angle2 = -spin_speed * t
-    
-    # First sphere
-    r_perturbation1 = amplitude * Y_tet_real * np.cos(t)
-    r1 = r_base + r_perturbation1
-    x1 = r1 * np.sin(phi) * np.cos(theta)
-    y1 = r1 * np.sin(phi) * np.sin(theta)
-    z1 = r1 * np.cos(phi)
-    x1_rot, y1_rot, z1_rot = rotate_z(x1, y1, z1, angle1)
-    
-    # Second sphere
-    r_perturbation2 = amplitude * Y_tet_real * np.cos(t + np.pi)
-    r2 = r_base + r_perturbation2
-    x2 = r2 * np.sin(phi) * np.cos(theta)
-    y2 = r2 * np.sin(phi) * np.sin(theta)
-    z2 = r2 * np.cos(phi)
-    x2_rot, y2_rot, z2_rot = rotate_z(x2, y2, z2, angle2)
-    
-    # Create figure for this frame
-    fig_frame = go.Figure(
-        data=[
-            go.Surface(
-                x=x1_rot, y=y1_rot, z=z1_rot,
-                colorscale=colorscale1,
-                showscale=False,
-                surfacecolor=Y_tet_real,
-                cmin=Y_tet_real.min(),
-                cmax=Y_tet_real.max()
-            ),
-            go.Surface(
-                x=x2_rot, y=y2_rot, z=z2_rot,
-                colorscale=colorscale2,
-                showscale=False,
-                surfacecolor=Y_tet_real,
-                cmin=Y_tet_real.min(),
-                cmax=Y_tet_real.max()
-            )
-        ]
-    )
-    
-    fig_frame.update_layout(
-        scene=dict(
-            xaxis=dict(range=[-max_radius * 1.1, max_radius * 1.1], autorange=False),
-            yaxis=dict(range=[-max_radius * 1.1, max_radius * 1.1], autorange=False),
-            zaxis=dict(range=[-max_radius * 1.1, max_radius * 1.1], autorange=False),
-            aspectmode='cube',
-            camera=dict(eye=dict(x=1.8, y=1.8, z=1.8)),
-            bgcolor='rgba(240, 240, 240, 1)'
-        ),
-        width=900,
-        height=900,
-        showlegend=False
-    )
-    
-    # Save frame as PNG
-    fig_frame.write_image(f'frames/frame_{i:03d}.png')
-    print(f"Saved frame {i+1}/{num_frames}")
+        # Canonical inputs stay valid cache keys when deduplication is skipped
+        canonical = deduplicate
+        if deduplicate:
+            # The states are compared before any frame inputs are hashed, so
+            # an animation with nothing to reuse pays nothing for deduplication
+            distinct = animation.distinct_states()
+            if distinct < num_frames:
+                print(f"Frame deduplication: {distinct} distinct states in {num_frames} frames, "
+                      f"renders saved: {num_frames - distinct}")
+            else:
+                print(f"Frame deduplication skipped: all {num_frames} frames have distinct states")
+                deduplicate = False
+            order = animation.symmetry_order
+            intervals = animation.theta.shape[1] - 1
+            if order > 1 and intervals % order:
+                print(f"  The {order}-fold symmetry is unused with {intervals + 1} theta points; "
+                      f"{intervals - intervals % order + order + 1} points would also reuse rotated frames")
+        # Frame keys are only needed to look renders up in the cache or to
+        # find repeated states
+        if cache is not None or deduplicate:
+            keys = [key(animation.frame_inputs(i, canonical=canonical)) for i in range(num_frames)]
+
+        # Frames are built and rasterized by a pool of workers and collected in
+        # order; only the first frame of each distinct state is built, and with a
+        # frame cache only states without a stored render
+        if cache is not None:
+            rendered = cache.render(animation.export_figure, keys, workers=workers, instrument=instrument)
+        elif deduplicate:
+            rendered = render_deduplicated(animation.export_figure, keys, workers=workers, instrument=instrument)
+        else:
+            rendered = render_frames_parallel(animation.export_figure, range(num_frames),
+                                              workers=workers, instrument=instrument)
+        decode = png_to_rgb
+
+    if export_mode == 'stream':
+        # Frames go through memory into a single ffmpeg process, no PNG files
+        with FFmpegWriter(video_path, framerate=framerate, crf=crf) as writer:
+            for i, frame in enumerate(crop_rendered(rendered, crop, crop_background, decode)):
+                with instrument.frame_span('encode', i):
+                    writer.write(frame)
+                print(f"Encoded frame {i+1}/{num_frames}")
+
+        print(f"\nMP4 video created: {video_path}")
+    else:
+        # Create a directory for frames
+        if not os.path.exists('frames'):
+            os.makedirs('frames')
+
+        # Save each frame as an image, cropped before it touches disk; files
+        # that already hold the same image are left untouched
+        if crop is None and decode is png_to_rgb:
+            frames = rendered
+        else:
+            frames = (encode_png(frame) for frame in crop_rendered(rendered, crop, crop_background, decode))
+        for i, png_bytes in enumerate(frames):
+            written = write_if_changed(f'frames/frame_{i:03d}.png', png_bytes)
+            print(f"{'Saved' if written else 'Unchanged'} frame {i+1}/{num_frames}")
+
+        print("\nFrames saved! Now converting to MP4...")
+        print("Run this command in your terminal:")
+        print(f"ffmpeg -r {framerate} -i frames/frame_%03d.png -vcodec libx264 -pix_fmt yuv420p -crf {crf} {video_path}")
+
+def main():
+    """Preview the animation, then export it with the settings above"""
+    instrument = Instrumentation(enabled=report_path is not None, profile=profile, trace_memory=trace_memory)
+    animation = SphereAnimation(instrument=instrument)
+    with instrument.span('preview'):
+        preview(animation)
+    with instrument.span('export'):
+        export(animation, instrument=instrument)
+    instrument.write_report(report_path)
 
-print("\nFrames saved! Now converting to MP4...")
-print("Run this command in your terminal:")
-print("ffmpeg -r 20 -i frames/frame_%03d.png -vcodec libx264 -pix_fmt yuv420p -crf 18 spheres_animation.mp4")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
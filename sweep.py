@@ -0,0 +1,194 @@
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from harmonic_cache import SharedHarmonics
+from instrumentation import NULL_INSTRUMENT
+
+# Batch rendering of superposition.py over many parameter combinations.
+# Every configuration becomes one SphereAnimation; harmonic terms are
+# loaded once per (l, m, grid) for the whole sweep, and the frames of all
+# jobs go through a single bounded worker pool, so workers never sit idle
+# between jobs and frames that look the same in several jobs are rendered
+# once. Each configuration gets its own video, listed in index.json.
+#
+#   python sweep.py
+#   python cli.py sweep --param amplitude=0.3,0.5 --param spin_speed=0.5,1
+
+# Sweep settings: every combination of these values is rendered. Keys are
+# SphereAnimation parameters (l, m_values, amplitude, spin_speed,
+# num_frames, r_base, grid_resolution, waves)
+sweep_grid = {
+    'amplitude': [0.3, 0.5],
+    'spin_speed': [0.5, 1.0],
+}
+output_dir = 'sweep'
+renderer = 'plotly'  # 'plotly': kaleido renders export_figure, 'numpy': built-in z-buffer rasterizer
+render_workers = os.cpu_count()  # processes rendering frames, shared by every job
+frame_cache_dir = 'frame_cache/sweep'  # plotly renders keyed by their inputs; None to disable
+framerate = 20
+crf = 18
+
+
+def expand_grid(grid):
+    """Every combination of the values in {parameter: [values]}, as config dicts"""
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def load_configs(path):
+    """Configurations from a JSON file: a grid {parameter: [values]} or a list of configs"""
+    with open(path) as f:
+        spec = json.load(f)
+    return expand_grid(spec) if isinstance(spec, dict) else spec
+
+
+def job_name(config):
+    """File-name friendly label of a configuration, e.g. amplitude=0.3_m_values=2,-2"""
+    def text(value):
+        if isinstance(value, dict):
+            return '(' + ','.join(f'{k}={text(v)}' for k, v in value.items()) + ')'
+        if isinstance(value, (list, tuple)):
+            return ','.join(text(v) for v in value)
+        return str(value)
+
+    return '_'.join(f'{key}={text(value)}' for key, value in config.items()) or 'default'
+
+
+class SweepFrames:
+    """The frames of every job being rendered, addressed by their flat index in the sweep
+
+    Its bound methods are what the pool workers run. The render pools send
+    them to each worker once, with the animations, so they work under any
+    multiprocessing start method.
+    """
+
+    def __init__(self):
+        self.animations = []
+        self.frames = []  # (job, frame) behind each flat index
+
+    def add(self, animation):
+        """Append every frame of animation"""
+        self.frames.extend((len(self.animations), i) for i in range(animation.num_frames))
+        self.animations.append(animation)
+
+    def export_figure(self, index):
+        """Build the export figure of one frame of the sweep"""
+        job, i = self.frames[index]
+        return self.animations[job].export_figure(i)
+
+    def rasterize_frame(self, index):
+        """Rasterize one frame of the sweep with the NumPy renderer"""
+        job, i = self.frames[index]
+        return self.animations[job].rasterize_frame(i)
+
+
+def run_sweep(configs, output_dir=output_dir, renderer=renderer, workers=render_workers,
+              frame_cache_dir=frame_cache_dir, framerate=framerate, crf=crf, crop=None,
+              harmonics=None, instrument=NULL_INSTRUMENT):
+    """Render one video per configuration into output_dir and write index.json
+
+    Videos whose frames, framerate and quality match the previous index
+    are kept as they are.
+    """
+    from superposition import SphereAnimation
+    from video_export import (FFmpegWriter, FrameCache, crop_rendered, expand_repeats, first_occurrences,
+                              input_key, png_to_rgb, render_deduplicated)
+
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    index_path = os.path.join(output_dir, 'index.json')
+    previous = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            previous = {job['name']: job for job in json.load(f)['jobs']}
+
+    harmonics = SharedHarmonics() if harmonics is None else harmonics
+    cache = None if renderer == 'numpy' or frame_cache_dir is None else FrameCache(frame_cache_dir)
+    key = input_key if cache is None else cache.key
+
+    jobs = []
+    with instrument.span('setup'):
+        for config in configs:
+            animation = SphereAnimation(**config, harmonics=harmonics)
+            name = job_name(config)
+            if not np.any(animation.patterns):
+                print(f"Warning: {name}: the harmonic patterns are zero everywhere "
+                      f"(their real parts cancel out), the spheres will not deform")
+            frame_keys = [key(animation.frame_inputs(i)) for i in range(animation.num_frames)]
+            video = os.path.join(output_dir, f'{name}.mp4')
+            job = {
+                'name': name,
+                'config': config,
+                'video': video,
+                'frames': animation.num_frames,
+                'distinct_frames': len(set(frame_keys)),
+                'key': input_key([frame_keys, renderer, framerate, crf, crop]),
+            }
+            job['up_to_date'] = (os.path.exists(video)
+                                 and previous.get(name, {}).get('key') == job['key'])
+            if job['up_to_date']:
+                job['seconds'] = previous[name].get('seconds')
+            jobs.append((job, animation, frame_keys))
+    print(f"Harmonic terms: {harmonics.loaded} loaded, {harmonics.reused} shared between jobs")
+
+    # One flat frame list over every job that needs rendering
+    sweep_frames, keys = SweepFrames(), []
+    for job, animation, frame_keys in jobs:
+        if job['up_to_date']:
+            print(f"Up to date: {job['video']}")
+            continue
+        sweep_frames.add(animation)
+        keys.extend(frame_keys)
+    if keys:
+        print(f"Sweep: {len(keys)} frames in {len(sweep_frames.animations)} videos, "
+              f"{len(set(keys))} distinct renders")
+
+    if renderer == 'numpy':
+        from rasterizer import rasterize_frames_parallel
+        rendered = expand_repeats(keys, rasterize_frames_parallel(sweep_frames.rasterize_frame, first_occurrences(keys),
+                                                                  workers=workers, instrument=instrument))
+        decode = np.asarray
+    elif cache is not None:
+        rendered = cache.render(sweep_frames.export_figure, keys, workers=workers, instrument=instrument)
+        decode = png_to_rgb
+    else:
+        rendered = render_deduplicated(sweep_frames.export_figure, keys, workers=workers, instrument=instrument)
+        decode = png_to_rgb
+
+    # Frames arrive in job order; each job's slice goes into its own video
+    # while the pool keeps rendering the next jobs
+    with instrument.span('encode'):
+        for job, animation, frame_keys in jobs:
+            if job['up_to_date']:
+                continue
+            job_start = time.perf_counter()
+            frames = itertools.islice(rendered, animation.num_frames)
+            with FFmpegWriter(job['video'], framerate=framerate, crf=crf) as writer:
+                for frame in crop_rendered(frames, crop, decode=decode):
+                    writer.write(frame)
+            job['seconds'] = round(time.perf_counter() - job_start, 3)
+            print(f"Video created: {job['video']} ({job['frames']} frames, {job['seconds']:.1f}s)")
+
+    index = {
+        'renderer': renderer,
+        'framerate': framerate,
+        'crf': crf,
+        'seconds': round(time.perf_counter() - start, 3),
+        'jobs': [job for job, _, _ in jobs],
+    }
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    print(f"Sweep index written to {index_path}")
+    return index
+
+
+def main():
+    """Render every combination of sweep_grid with the settings above"""
+    run_sweep(expand_grid(sweep_grid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from scipy.spatial.transform import Rotation
+
+from harmonic_cache import SYMMETRY_PRESETS, HarmonicCache
+
+# Symmetry checks for the SYMMETRY_PRESETS combinations: each pattern must
+# be unchanged by the generators of its rotation group, and must not be
+# unchanged by a rotation outside it.
+#
+#   python -m pytest test_harmonic_cache.py
+
+
+def rotation(axis, order):
+    """Rotation by 2π/order about axis"""
+    axis = np.asarray(axis, dtype=float)
+    return Rotation.from_rotvec(axis / np.linalg.norm(axis) * 2 * np.pi / order)
+
+
+# Icosahedron with a 5-fold axis along Z: the next vertex is at polar
+# angle arctan(2), half a sector off the X axis
+ICOSAHEDRAL_VERTEX = [np.sin(np.arctan(2)) * np.cos(np.pi / 5), np.sin(np.arctan(2)) * np.sin(np.pi / 5),
+                      np.cos(np.arctan(2))]
+
+# Generators of each preset's rotation group, and a rotation that is not in it
+SYMMETRIES = {
+    'legacy': ([rotation([0, 0, 1], 3), rotation([1, 0, 0], 2)], rotation([0, 0, 1], 6)),
+    'tetrahedral': ([rotation([0, 0, 1], 2), rotation([np.sqrt(2), 0, 1], 3)], rotation([0, 0, 1], 4)),
+    'octahedral': ([rotation([0, 0, 1], 4), rotation([1, 0, 0], 4)], rotation([0, 0, 1], 8)),
+    'icosahedral': ([rotation([0, 0, 1], 5), rotation(ICOSAHEDRAL_VERTEX, 5)], rotation([0, 0, 1], 10)),
+}
+
+
+def pattern(cache, name, points):
+    """Real part of the preset's combination at unit vectors points"""
+    polar = np.arccos(np.clip(points[:, 2], -1, 1))
+    azimuth = np.arctan2(points[:, 1], points[:, 0])
+    return cache.combination(name, polar, azimuth, kind='real')
+
+
+@pytest.fixture
+def points():
+    points = np.random.default_rng(0).normal(size=(500, 3))
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def test_every_preset_is_checked():
+    assert set(SYMMETRIES) == set(SYMMETRY_PRESETS)
+
+
+@pytest.mark.parametrize('name', sorted(SYMMETRY_PRESETS))
+def test_preset_terms_are_nonzero(tmp_path, points, name):
+    cache = HarmonicCache(str(tmp_path))
+    for l, m, _ in SYMMETRY_PRESETS[name]:
+        assert abs(m) <= l, f"sph_harm_y({l}, {m}) is zero everywhere"
+    assert np.std(pattern(cache, name, points)) > 0.1
+
+
+@pytest.mark.parametrize('name', sorted(SYMMETRY_PRESETS))
+def test_preset_symmetry(tmp_path, points, name):
+    cache = HarmonicCache(str(tmp_path))
+    generators, outside = SYMMETRIES[name]
+    values = pattern(cache, name, points)
+    for generator in generators:
+        np.testing.assert_allclose(pattern(cache, name, generator.apply(points)), values, atol=1e-9)
+    assert not np.allclose(pattern(cache, name, outside.apply(points)), values, atol=1e-3)
+
+
+def test_default_waves_use_the_legacy_preset():
+    from superposition import default_waves
+
+    for wave in default_waves():
+        assert wave['terms'] == SYMMETRY_PRESETS['legacy']
+
+
+@pytest.mark.parametrize('terms', [[(3, 4)], [(2, -3, 1.0)]])
+def test_wave_terms_outside_the_degree_are_rejected(terms):
+    from superposition import wave_component
+
+    with pytest.raises(ValueError, match=r'\|m\| <= l'):
+        wave_component(terms)
+
+
+def test_default_waves_take_degree_then_orders():
+    from superposition import default_waves
+
+    for wave in default_waves(l=5, m_values=[2, -4]):
+        assert wave['terms'] == [(5, 2, 1.0), (5, -4, 1.0)]
+    with pytest.raises(ValueError):
+        default_waves(l=2, m_values=[3])
+
+
+def test_grids_with_the_same_shape_and_bounds_get_their_own_entries(tmp_path):
+    cache = HarmonicCache(str(tmp_path))
+    uniform = np.linspace(0, np.pi, 7)
+    stretched = np.pi * np.linspace(0, 1, 7) ** 2
+    azimuth = np.linspace(0, 2 * np.pi, 7)
+    first = np.array(cache.sph_harm_y(3, 2, uniform, azimuth))
+    second = np.array(cache.sph_harm_y(3, 2, stretched, azimuth))
+    assert len(cache.entries()) == 2
+    assert not np.allclose(first, second)
@@ -0,0 +1,515 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import subprocess
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+
+# Helpers to turn rendered frames into a video without writing
+# intermediate PNG files: frames are decoded in memory, optionally
+# cropped, and piped as raw RGB into a single ffmpeg process.
+
+
+def png_to_rgb(png_bytes):
+    """Decode PNG bytes to an (height, width, 3) uint8 RGB array"""
+    from PIL import Image
+
+    return np.asarray(Image.open(io.BytesIO(png_bytes)).convert('RGB'))
+
+
+# Frame builder of a render worker, installed by the pool initializer so
+# it is sent to each worker once rather than with every frame
+_worker_build_frame = None
+
+
+def _init_render_worker(build_frame):
+    """Install the worker's frame builder and keep one Kaleido renderer warm for its lifetime"""
+    global _worker_build_frame
+    _worker_build_frame = build_frame
+    try:
+        import kaleido
+    except ImportError:
+        # Let the render call itself report the missing dependency
+        return
+
+    # Kaleido >= 1 launches a fresh browser per call unless a sync server is
+    # running; older versions keep a persistent scope on their own
+    start_server = getattr(kaleido, 'start_sync_server', None)
+    if start_server is None:
+        return
+    # The sync server hangs every later call if its browser fails to start,
+    # so only use it when Chrome can be found; otherwise each render call
+    # raises plotly's "Chrome required" error. Never raise from here: a
+    # failing initializer makes the pool respawn workers forever
+    try:
+        from choreographer.browsers.chromium import Chromium
+        if not Chromium.find_browser(skip_local=False):
+            return
+        start_server(silence_warnings=True)
+    except Exception:
+        return
+    # Pool workers skip atexit, so shut the browser down via a finalizer
+    multiprocessing.util.Finalize(None, kaleido.stop_sync_server, exitpriority=10)
+
+
+def _render_frame(width, height, index):
+    """Build frame `index` in the worker and rasterize it to PNG bytes
+
+    Also returns the seconds spent building and rasterizing the frame.
+    """
+    start = time.perf_counter()
+    fig = _worker_build_frame(index)
+    built = time.perf_counter()
+    png_bytes = fig.to_image(format='png', width=width, height=height)
+    return png_bytes, built - start, time.perf_counter() - built
+
+
+def render_frames_parallel(build_frame, frame_indices, width=None, height=None, workers=None,
+                           instrument=None):
+    """Rasterize build_frame(i) for each index over a process pool
+
+    Yields PNG bytes in frame order. Each worker builds its own figures, so
+    `build_frame` must be picklable: a module-level function or a bound
+    method of a picklable object. It is sent to each worker once, when
+    the worker starts, so large builders cost nothing per frame; `workers`
+    defaults to the number of CPUs. Per-frame build and rasterize times measured in the
+    workers are recorded on `instrument` when one is given.
+    """
+    frame_indices = list(frame_indices)
+    if not frame_indices:
+        return iter(())
+    # Fork the workers now rather than on the first next(): workers forked
+    # after the caller has started ffmpeg would inherit its stdin pipe, and
+    # ffmpeg would never see the end of its input
+    pool = multiprocessing.Pool(workers, initializer=_init_render_worker, initargs=(build_frame,))
+    results = pool.imap(partial(_render_frame, width, height), frame_indices)
+    return _collect_renders(pool, frame_indices, results, instrument)
+
+
+def _collect_renders(pool, frame_indices, results, instrument):
+    """Yield PNG bytes from the pool in frame order, then shut the pool down"""
+    try:
+        for index, (png_bytes, build_s, render_s) in zip(frame_indices, results):
+            if instrument is not None:
+                instrument.record_frame('build', index, build_s)
+                instrument.record_frame('rasterize', index, render_s)
+            yield png_bytes
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        # Let workers exit normally so their renderers are shut down
+        pool.close()
+    finally:
+        pool.join()
+
+
+def _json_default(value):
+    """Hash arrays instead of serializing them into cache keys"""
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return {'dtype': str(value.dtype), 'shape': list(value.shape),
+                'sha1': hashlib.sha1(value.tobytes()).hexdigest()}
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot use {type(value).__name__} in a frame cache key")
+
+
+def input_key(inputs):
+    """sha1 of JSON-compatible inputs; numpy arrays are hashed by content"""
+    text = json.dumps(inputs, sort_keys=True, default=_json_default)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _renderer_versions():
+    """Versions of the packages that rasterize frames, part of every cache key"""
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = {}
+    for package in ('plotly', 'kaleido'):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temporary file, so readers never see half a file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class FrameCache:
+    """Content-addressed store of rendered frames with a resumable manifest
+
+    Each render is saved as <key>.png, where the key hashes every input
+    that affects the image (parameters, time, resolution, camera) plus the
+    renderer versions. manifest.json maps frame indices to keys and is
+    updated as frames complete, so an interrupted export resumes where it
+    stopped and unchanged frames are never rendered again.
+
+    Like HarmonicCache, the store is bounded: once the renders exceed
+    max_bytes, the least recently used ones are deleted, except those of
+    the frames being exported.
+    """
+
+    def __init__(self, directory, max_bytes=1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        os.makedirs(directory, exist_ok=True)
+        self.previous = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.previous = json.load(f)['frames']
+        self.frames = {}
+        self._renderer = _renderer_versions()
+
+    def key(self, inputs):
+        """Hash of a frame's inputs (any JSON-compatible value, arrays allowed)"""
+        return input_key([inputs, self._renderer])
+
+    def path(self, key):
+        """File holding the render for key"""
+        return os.path.join(self.directory, f'{key}.png')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def record(self, index, key):
+        """Note that frame index is the render stored under key"""
+        self.frames[str(index)] = key
+        _write_atomic(self.manifest_path, json.dumps({'frames': self.frames}, indent=1).encode())
+
+    def render(self, build_frame, keys, width=None, height=None, workers=None, instrument=None):
+        """Yield PNG bytes for frames 0..len(keys)-1, rendering only missing keys
+
+        keys[i] is the cache key of frame i; build_frame(i) is called (in a
+        pool, see render_frames_parallel) only for the first frame of each
+        key that has no stored render yet; frames sharing a key share the
+        render. Renders are stored as they are consumed.
+        """
+        keys = list(keys)
+        pending, queued = [], set()
+        for i, key in enumerate(keys):
+            if key not in self and key not in queued:
+                pending.append(i)
+                queued.add(key)
+        stale = sum(1 for i in pending if self.previous.get(str(i)) not in (None, keys[i]))
+        distinct = len(set(keys))
+        print(f"Frame cache: {distinct - len(pending)} of {distinct} distinct frames up to date, "
+              f"rendering {len(pending)} ({stale} stale, {len(pending) - stale} missing)")
+
+        rendered = render_frames_parallel(build_frame, pending, width, height, workers, instrument)
+        pending = set(pending)
+        in_use = {self.path(key) for key in keys}
+        for i, key in enumerate(keys):
+            if i in pending:
+                png_bytes = next(rendered)
+                _write_atomic(self.path(key), png_bytes)
+                self.evict(keep=in_use)
+            else:
+                with open(self.path(key), 'rb') as f:
+                    png_bytes = f.read()
+                # Touch the render so eviction sees it as recently used
+                os.utime(self.path(key))
+            self.record(i, key)
+            yield png_bytes
+
+    def entries(self):
+        """Stored renders as (mtime, size, path), least recently used first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=()):
+        """Delete least recently used renders until the store fits max_bytes"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def first_occurrences(keys):
+    """Indices of the first frame of each distinct key, in frame order"""
+    first = {}
+    for i, key in enumerate(keys):
+        first.setdefault(key, i)
+    return sorted(first.values())
+
+
+def expand_repeats(keys, rendered):
+    """Yield one render per key, taking renders of first occurrences from `rendered`
+
+    `rendered` yields the renders of first_occurrences(keys) in order;
+    frames sharing a key reuse the first one's render, which is kept in
+    memory only until its last repeat.
+    """
+    keys = list(keys)
+    last = {key: i for i, key in enumerate(keys)}
+    held = {}
+    for i, key in enumerate(keys):
+        frame = held[key] if key in held else next(rendered)
+        if last[key] > i:
+            held[key] = frame
+        else:
+            held.pop(key, None)
+        yield frame
+
+
+def render_deduplicated(build_frame, keys, width=None, height=None, workers=None, instrument=None):
+    """Yield PNG bytes for frames 0..len(keys)-1, rendering each distinct key once
+
+    Frames sharing a key reuse the first one's render, which is kept in
+    memory only until its last repeat.
+    """
+    keys = list(keys)
+    rendered = render_frames_parallel(build_frame, first_occurrences(keys), width, height, workers, instrument)
+    yield from expand_repeats(keys, rendered)
+
+
+def crop_frame(frame, crop):
+    """Crop an image array by (top, bottom, left, right) margins in pixels"""
+    if crop is None:
+        return frame
+    top, bottom, left, right = crop
+    height, width = frame.shape[:2]
+    return frame[top:height - bottom, left:width - right]
+
+
+class AutoCrop:
+    """Union bounding box of non-background pixels over a set of frames
+
+    background is a list of RGB colours treated as empty (default: the
+    colour of the first frame's top-left pixel). Using one box for every
+    frame keeps the crop stable, so moving content is never clipped.
+    """
+
+    def __init__(self, background=None, tolerance=8, padding=4):
+        self.background = None if background is None else np.asarray(background, dtype=int).reshape(-1, 3)
+        self.tolerance = tolerance
+        self.padding = padding
+        self.shape = None
+        self.box = None  # (top, bottom, left, right) as inclusive pixel indices
+
+    def update(self, frame):
+        """Grow the box to cover the content of one frame"""
+        frame = np.asarray(frame)[:, :, :3].astype(np.int16)
+        if self.background is None:
+            self.background = frame[:1, 0].astype(int)
+        if self.shape is None:
+            self.shape = frame.shape[:2]
+
+        # A pixel is content if it differs from every background colour
+        content = np.ones(frame.shape[:2], dtype=bool)
+        for colour in self.background:
+            content &= np.abs(frame - colour).max(axis=2) > self.tolerance
+
+        rows = np.flatnonzero(content.any(axis=1))
+        cols = np.flatnonzero(content.any(axis=0))
+        if rows.size:
+            self._grow((int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])))
+
+    def merge(self, other):
+        """Grow the box to cover another AutoCrop's box (e.g. from a worker)"""
+        if self.shape is None:
+            self.shape = other.shape
+        if other.box is not None:
+            self._grow(other.box)
+
+    def _grow(self, box):
+        """Union the current box with box"""
+        if self.box is None:
+            self.box = box
+        else:
+            self.box = (min(self.box[0], box[0]), max(self.box[1], box[1]),
+                        min(self.box[2], box[2]), max(self.box[3], box[3]))
+
+    def margins(self):
+        """The box as (top, bottom, left, right) crop margins, padded"""
+        if self.box is None:
+            return None
+        height, width = self.shape
+        top, bottom, left, right = self.box
+        return (max(0, top - self.padding),
+                max(0, height - 1 - bottom - self.padding),
+                max(0, left - self.padding),
+                max(0, width - 1 - right - self.padding))
+
+
+def crop_rendered(rendered, crop=None, background=None, decode=png_to_rgb):
+    """Decode rendered frames and yield cropped RGB frames
+
+    crop is None, (top, bottom, left, right) margins, or 'auto' to crop
+    every frame to the union bounding box of their content. decode turns
+    one rendered frame into an RGB array (np.asarray for frames that are
+    already arrays).
+    """
+    if crop != 'auto':
+        for frame in rendered:
+            yield crop_frame(decode(frame), crop)
+        return
+
+    # The box is only known once every frame has been seen: keep the
+    # rendered frames (compressed PNGs for kaleido renders) in memory and
+    # decode them a second time to crop
+    rendered = list(rendered)
+    auto_crop = AutoCrop(background)
+    for frame in rendered:
+        auto_crop.update(decode(frame))
+    margins = auto_crop.margins()
+    print(f"Auto-crop margins (top, bottom, left, right): {margins}")
+    for frame in rendered:
+        yield crop_frame(decode(frame), margins)
+
+
+def encode_png(frame):
+    """Encode an RGB array as PNG bytes"""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(frame)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def write_if_changed(path, data):
+    """Write bytes to path unless it already holds exactly them; True if written"""
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    _write_atomic(path, data)
+    return True
+
+
+class FFmpegWriter:
+    """Stream raw RGB frames into ffmpeg over stdin
+
+    The frame size is taken from the first (cropped) frame. Raises
+    RuntimeError with ffmpeg's error output if ffmpeg fails.
+    """
+
+    def __init__(self, output_path, framerate=20, crf=18, crop=None,
+                 codec='libx264', pix_fmt='yuv420p', ffmpeg='ffmpeg'):
+        self.output_path = output_path
+        self.framerate = framerate
+        self.crf = crf
+        self.crop = crop
+        self.codec = codec
+        self.pix_fmt = pix_fmt
+        self.ffmpeg = ffmpeg
+        self.size = None
+        self.frame_count = 0
+        self._process = None
+        self._stderr = None
+
+    def _start(self, width, height):
+        """Launch ffmpeg reading rawvideo frames of the given size from stdin"""
+        command = [
+            self.ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}', '-framerate', str(self.framerate),
+            '-i', '-',
+            '-c:v', self.codec, '-pix_fmt', self.pix_fmt, '-crf', str(self.crf),
+            self.output_path
+        ]
+        # stderr goes to a temporary file so a chatty ffmpeg can never block the pipe
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                             stderr=self._stderr)
+        except FileNotFoundError:
+            self._stderr.close()
+            raise RuntimeError(f"ffmpeg executable not found: {self.ffmpeg!r}. "
+                               "Install it from https://ffmpeg.org/download.html") from None
+        self.size = (width, height)
+
+    def _error_output(self):
+        """Return whatever ffmpeg wrote to stderr"""
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors='replace').strip()
+
+    def write(self, frame):
+        """Append one (height, width, 3|4) uint8 frame to the video"""
+        frame = crop_frame(np.asarray(frame), self.crop)[:, :, :3]
+        # yuv420p needs even dimensions: drop a trailing odd row/column
+        height, width = frame.shape[0] & ~1, frame.shape[1] & ~1
+        frame = frame[:height, :width]
+
+        if self._process is None:
+            self._start(width, height)
+        elif (width, height) != self.size:
+            raise ValueError(f"Frame {self.frame_count} is {width}x{height}, "
+                             f"expected {self.size[0]}x{self.size[1]}")
+
+        try:
+            self._process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).tobytes())
+        except BrokenPipeError:
+            # ffmpeg died: collect its exit status and report the error
+            self.close()
+            raise RuntimeError(f"ffmpeg closed its input after {self.frame_count} frames")
+        self.frame_count += 1
+
+    def close(self):
+        """Flush the pipe, wait for ffmpeg and raise if it failed"""
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+        message = self._error_output()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {returncode} while writing "
+                               f"{self.output_path}:\n{message}")
+
+    def abort(self):
+        """Kill ffmpeg without waiting for the video to be finalised"""
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        process.kill()
+        process.wait()
+        self._stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False